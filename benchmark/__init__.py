@@ -0,0 +1,4 @@
+# benchmark/__init__.py
+'''
+    Offline benchmarks that run without a camera, GPIO or MQTT.
+'''
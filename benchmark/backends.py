@@ -0,0 +1,93 @@
+# benchmark/backends.py
+'''
+    Side-by-side latency benchmark of the inference backends in boxprocess.py
+
+    python -m benchmark.backends --source clip.mp4 --frames 200
+    python -m benchmark.backends --backends ncnn --json
+'''
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from boxprocess import BACKENDS, MODEL_PATH
+
+
+def load_frames(source, count, width=640, height=360):
+    """Read up to `count` frames from a video file; fall back to noise frames when no source."""
+    frames = []
+    if source:
+        cap = cv2.VideoCapture(source)
+        while len(frames) < count:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(cv2.resize(frame, (width, height)))
+        cap.release()
+    rng = np.random.default_rng(0)
+    while len(frames) < count:
+        frames.append(rng.integers(0, 255, (height, width, 3), dtype=np.uint8))
+    return frames
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else 0.0
+
+
+def run_backend(name, frames, model_path, imgsz, warmup):
+    backend = BACKENDS[name](model_path, imgsz, 0.4, 0.4, [0])
+    for frame in frames[:warmup]:
+        backend.infer(frame)
+    latencies, counts = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        boxes = backend.infer(frame)
+        latencies.append(time.perf_counter() - start)
+        counts.append(len(boxes))
+    total = sum(latencies)
+    return {
+        "backend": name,
+        "frames": len(frames),
+        "mean_ms": total / len(frames) * 1000,
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "fps": len(frames) / total if total > 0 else 0.0,
+    }, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare detector backends on the same frames")
+    parser.add_argument("--source", help="video file to read frames from (default: random frames)")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--imgsz", type=int, default=416)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.frames)
+    report, counts = [], {}
+    for name in args.backends:
+        stats, counts[name] = run_backend(name, frames, args.model, args.imgsz, args.warmup)
+        report.append(stats)
+
+    # Person-count agreement of every backend against the first one
+    ref = args.backends[0]
+    for stats in report:
+        same = sum(a == b for a, b in zip(counts[ref], counts[stats["backend"]]))
+        stats["count_agreement"] = same / len(frames)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'backend':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'fps':>10}{'agree':>8}")
+    for s in report:
+        print(f"{s['backend']:<12}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}"
+              f"{s['p95_ms']:>10.2f}{s['fps']:>10.1f}{s['count_agreement']:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# benchmark/hotpath.py
+'''
+    Offline benchmark of the per-camera hot path: decode -> gate -> inference -> deliver
+    -> track/propagate -> count_objects_in_polygons -> render, on recorded clips with the
+    zones from polygons.json. No camera, GPIO, MQTT or serial check involved.
+
+    python -m benchmark.hotpath --source recordings/cam1.mp4 --frames 300
+    python -m benchmark.hotpath --source a.mp4 b.mp4 --cam-ids 25 26 --schedule --json
+'''
+import argparse
+import json
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from boxprocess import (BACKENDS, MODEL_PATH, ModelboxProcess, InferenceEngine, InferenceScheduler,
+                        MotionGate, BoxPropagator)
+from benchmark.backends import load_frames, percentile_ms
+from polygon_store import PolygonStore
+from tracker import ByteTracker
+
+WIDTH, HEIGHT = 640, 360
+STAGES = ("decode", "gate", "infer", "deliver", "track", "count", "render", "total")
+
+
+class StageTimer:
+    """Collects per-stage samples; `wrap` times an existing bound method in place."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def report(self):
+        out = {}
+        for stage in STAGES:
+            samples = self.samples.get(stage, [])
+            out[stage] = {
+                "calls": len(samples),
+                "mean_ms": float(np.mean(samples) * 1000) if samples else 0.0,
+                "p50_ms": percentile_ms(samples, 50),
+                "p95_ms": percentile_ms(samples, 95),
+                "p99_ms": percentile_ms(samples, 99),
+                "max_ms": float(max(samples) * 1000) if samples else 0.0,
+            }
+        return out
+
+
+def clip_reader(source):
+    """Endless frame generator over a clip (rewinds at the end); decode time is measured by the caller."""
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise SystemExit(f"❌ Cannot open {source}")
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = cap.read()
+            if not ok:
+                return
+        if frame.shape[:2] != (HEIGHT, WIDTH):
+            frame = cv2.resize(frame, (WIDTH, HEIGHT))
+        yield frame
+
+
+def synthetic_reader(count):
+    frames = load_frames(None, count, WIDTH, HEIGHT)
+    while True:
+        yield from frames
+
+
+def load_zones(path, cam_ids, cameras):
+    """Polygons per benchmarked camera: explicit --cam-ids, else the cameras of polygons.json in order."""
+    store = PolygonStore(path)
+    ids = list(cam_ids or [c.get("id") for c in store.get_all()["cameras"]])
+    return [store.get_polygons(ids[i]) if i < len(ids) else [] for i in range(cameras)]
+
+
+def build_model(args, engine, polygons, timer):
+    scheduler = InferenceScheduler(target_fps=args.target_fps, budget=args.budget)
+    gate = MotionGate(WIDTH, HEIGHT) if args.motion_gate else None
+    model = ModelboxProcess(WIDTH, HEIGHT, polygons=polygons, engine=engine, scheduler=scheduler,
+                            motion_gate=gate, zone_crop=args.zone_crop,
+                            propagator=BoxPropagator(args.propagation),
+                            tracker=ByteTracker(high_thresh=engine.conf, new_thresh=engine.conf) if args.tracker else None)
+    # time the pieces process() calls, without touching the class
+    model.count_objects_in_polygons = timer.wrap("count", model.count_objects_in_polygons)
+    if model.tracker is not None:
+        model.tracker.step = timer.wrap("track", model.tracker.step)
+    else:
+        model.propagator.advance = timer.wrap("track", model.propagator.advance)
+    return model
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return 0.0
+
+
+def run(args):
+    sources = args.source or [None]
+    readers = [clip_reader(s) if s else synthetic_reader(64) for s in sources]
+    zones = load_zones(args.polygons, args.cam_ids, len(readers))
+
+    engine = InferenceEngine(model_path=args.model, backend=args.backend, imgsz=args.imgsz,
+                             num_threads=args.threads)
+    engine.warmup(args.warmup)
+    timers = [StageTimer() for _ in readers]
+    models = [build_model(args, engine, polys, t) for polys, t in zip(zones, timers)]
+
+    if args.trace_alloc:
+        tracemalloc.start()
+    rss_start = rss_mb()
+    wall = time.perf_counter()
+    for _ in range(args.frames):
+        for reader, model, timer in zip(readers, models, timers):
+            t0 = time.perf_counter()
+            img = next(reader)
+            t1 = time.perf_counter()
+            run_detector = model.should_infer(img) if args.schedule else True
+            t2 = time.perf_counter()
+            timer.add("decode", t1 - t0)
+            timer.add("gate", t2 - t1)
+            if run_detector:
+                view, offset = model.detector_input(img)
+                detections = engine.predict([view], [model.input_size()])[0]
+                t3 = time.perf_counter()
+                model.deliver(detections, offset)
+                timer.add("infer", t3 - t2)
+                timer.add("deliver", time.perf_counter() - t3)
+            tracked, counted = len(timer.samples["track"]), len(timer.samples["count"])
+            t4 = time.perf_counter()
+            model.process(img, None, show_regions=args.render, show_boxes=args.render)
+            t5 = time.perf_counter()
+            inner = sum(timer.samples["track"][tracked:]) + sum(timer.samples["count"][counted:])
+            timer.add("render", max(0.0, (t5 - t4) - inner))
+            timer.add("total", t5 - t0)
+    wall = time.perf_counter() - wall
+    peak_alloc = 0
+    if args.trace_alloc:
+        _, peak_alloc = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    cameras = []
+    for source, model, timer in zip(sources, models, timers):
+        cameras.append({
+            "source": source or "synthetic",
+            "zones": sum(1 for p in model.polygons if p["coord"]),
+            "inferred": len(timer.samples["infer"]),
+            "stages": timer.report(),
+        })
+    return {
+        "frames_per_camera": args.frames,
+        "cameras": cameras,
+        "fps_per_camera": args.frames / wall if wall > 0 else 0.0,
+        "fps_total": args.frames * len(readers) / wall if wall > 0 else 0.0,
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(rss_mb(), 1),
+            "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "python_peak_alloc_mb": round(peak_alloc / 2**20, 2) if args.trace_alloc else None,
+        },
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ModelboxProcess hot path on recorded clips")
+    parser.add_argument("--source", nargs="+", help="one clip per camera (default: one synthetic camera)")
+    parser.add_argument("--polygons", default="polygons.json")
+    parser.add_argument("--cam-ids", nargs="+", type=int, help="polygons.json camera ids, one per source")
+    parser.add_argument("--frames", type=int, default=300, help="frames per camera")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--backend", default="ultralytics", choices=list(BACKENDS))
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=416)
+    parser.add_argument("--threads", type=int, default=None, help="NCNN threads (default: library)")
+    parser.add_argument("--schedule", action="store_true", help="use the adaptive scheduler instead of every frame")
+    parser.add_argument("--target-fps", type=float, default=15)
+    parser.add_argument("--budget", type=float, default=0.6)
+    parser.add_argument("--motion-gate", action="store_true")
+    parser.add_argument("--zone-crop", action="store_true")
+    parser.add_argument("--propagation", default="none", choices=["none", "velocity", "flow"])
+    parser.add_argument("--no-tracker", dest="tracker", action="store_false")
+    parser.add_argument("--no-render", dest="render", action="store_false")
+    parser.add_argument("--trace-alloc", action="store_true",
+                        help="track Python allocation peak with tracemalloc (slows every stage)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    for cam in result["cameras"]:
+        print(f"\n{cam['source']}  zones={cam['zones']}  inferred={cam['inferred']}/{args.frames}")
+        print(f"{'stage':<10}{'calls':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for stage, s in cam["stages"].items():
+            print(f"{stage:<10}{s['calls']:>7}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}"
+                  f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    mem = result["memory"]
+    print(f"\nFPS: {result['fps_per_camera']:.1f} per camera, {result['fps_total']:.1f} total")
+    print(f"Memory: RSS {mem['rss_start_mb']} -> {mem['rss_end_mb']} MB (peak {mem['rss_peak_mb']} MB)"
+          + (f", Python allocations peak {mem['python_peak_alloc_mb']} MB" if args.trace_alloc else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# benchmark/int8.py
+'''
+    Build and evaluate the INT8-calibrated variant of the NCNN detector
+
+    python -m benchmark.int8 capture --frames 300 --interval 1.0      # frames from CameraConnection
+    python -m benchmark.int8 build                                    # ncnnoptimize -> ncnn2table -> ncnn2int8
+    python -m benchmark.int8 compare --backend ncnn --json            # FP vs INT8 latency / count agreement
+
+    The INT8 model is written to `<model>_int8/` (param, bin, metadata.yaml and the
+    calibration table) and is picked up at runtime with `Inference: precision: int8`.
+    Requires the ncnn tools (ncnnoptimize, ncnn2table, ncnn2int8) on PATH.
+'''
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from boxprocess import BACKENDS, MODEL_PATH
+from benchmark.backends import load_frames, run_backend
+
+CALIB_DIR = "calibration"
+
+
+def letterbox(frame, imgsz):
+    """Same letterbox as the runtime backends, so the table sees what inference sees."""
+    h, w = frame.shape[:2]
+    gain = min(imgsz / h, imgsz / w)
+    nw, nh = int(round(w * gain)), int(round(h * gain))
+    out = np.full((imgsz, imgsz, 3), 114, np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    out[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return out
+
+
+def capture(args):
+    """Grab frames from the configured cameras, spaced out so the set covers the scene over time."""
+    from camera import CameraConnection
+
+    setting = {"cameras": [{"type": "webcam"}]}
+    if args.cameras:
+        with open(args.cameras, "r") as f:
+            setting = json.load(f)
+    cameras = CameraConnection()
+    cameras.apply_config(setting)
+    os.makedirs(args.calib, exist_ok=True)
+
+    saved = 0
+    deadline = time.time() + args.timeout
+    try:
+        while saved < args.frames and time.time() < deadline:
+            for frame in cameras.read_frame():
+                cv2.imwrite(os.path.join(args.calib, f"{saved:05d}.jpg"), letterbox(frame, args.imgsz))
+                saved += 1
+            time.sleep(args.interval)
+    finally:
+        cameras.del_all_camera()
+    print(f"📸 Saved {saved} calibration frames to {args.calib}")
+
+
+def run_tool(cmd):
+    print("▶", " ".join(cmd))
+    subprocess.run(cmd, check=True)
+
+
+def build(args):
+    """ncnnoptimize -> ncnn2table (KL) -> ncnn2int8, then copy metadata so both backends can load it."""
+    for tool in ("ncnnoptimize", "ncnn2table", "ncnn2int8"):
+        if shutil.which(tool) is None:
+            raise SystemExit(f"❌ {tool} not found on PATH (build ncnn with NCNN_BUILD_TOOLS=ON)")
+    images = sorted(os.path.abspath(os.path.join(args.calib, f))
+                    for f in os.listdir(args.calib) if f.endswith(".jpg"))
+    if not images:
+        raise SystemExit(f"❌ No calibration frames in {args.calib}, run `capture` first")
+
+    out_dir = f"{args.model}_int8"
+    os.makedirs(out_dir, exist_ok=True)
+    param, weights = f"{args.model}/model.ncnn.param", f"{args.model}/model.ncnn.bin"
+    table = os.path.join(out_dir, "model.table")
+    with tempfile.TemporaryDirectory() as tmp:
+        opt_param, opt_bin = os.path.join(tmp, "opt.param"), os.path.join(tmp, "opt.bin")
+        imagelist = os.path.join(tmp, "imagelist.txt")
+        with open(imagelist, "w") as f:
+            f.write("\n".join(images) + "\n")
+        run_tool(["ncnnoptimize", param, weights, opt_param, opt_bin, "0"])
+        # inputs are RGB scaled to [0, 1], exactly like the runtime preprocessing
+        run_tool(["ncnn2table", opt_param, opt_bin, imagelist, table,
+                  "mean=[0,0,0]", "norm=[0.003922,0.003922,0.003922]",
+                  f"shape=[{args.imgsz},{args.imgsz},3]", "pixel=RGB",
+                  f"thread={args.threads}", f"method={args.method}"])
+        run_tool(["ncnn2int8", opt_param, opt_bin,
+                  os.path.join(out_dir, "model.ncnn.param"), os.path.join(out_dir, "model.ncnn.bin"), table])
+    meta = os.path.join(args.model, "metadata.yaml")
+    if os.path.exists(meta):
+        shutil.copy(meta, out_dir)
+    print(f"✅ INT8 model written to {out_dir} ({len(images)} calibration frames)")
+
+
+def load_calibration_frames(calib, count):
+    frames = []
+    for name in sorted(os.listdir(calib))[:count]:
+        frame = cv2.imread(os.path.join(calib, name))
+        if frame is not None:
+            frames.append(frame)
+    return frames
+
+
+def compare(args):
+    """Latency of both variants and how often INT8 reports the same person count as FP."""
+    if args.source:
+        frames = load_frames(args.source, args.frames)
+    else:
+        frames = load_calibration_frames(args.calib, args.frames)
+    if not frames:
+        raise SystemExit("❌ No frames to compare on (use --source or run `capture`)")
+
+    variants = {"fp32": args.model, "int8": f"{args.model}_int8"}
+    report, counts = [], {}
+    for precision, path in variants.items():
+        if not os.path.isdir(path):
+            raise SystemExit(f"❌ {path} not found, run `build` first")
+        stats, counts[precision] = run_backend(args.backend, frames, path, args.imgsz, args.warmup)
+        stats["precision"] = precision
+        report.append(stats)
+
+    fp, q = np.asarray(counts["fp32"]), np.asarray(counts["int8"])
+    for stats in report:
+        stats["count_agreement"] = float(np.mean(fp == q)) if stats["precision"] == "int8" else 1.0
+        stats["count_mae"] = float(np.mean(np.abs(fp - q))) if stats["precision"] == "int8" else 0.0
+    speedup = report[0]["mean_ms"] / report[1]["mean_ms"] if report[1]["mean_ms"] else 0.0
+
+    if args.json:
+        print(json.dumps({"frames": len(frames), "speedup": speedup, "variants": report}, indent=2))
+        return
+    print(f"{'precision':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'fps':>10}{'agree':>8}{'mae':>8}")
+    for s in report:
+        print(f"{s['precision']:<12}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}"
+              f"{s['fps']:>10.1f}{s['count_agreement']:>8.0%}{s['count_mae']:>8.2f}")
+    print(f"INT8 speed-up: x{speedup:.2f} over {len(frames)} frames")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 calibration and FP/INT8 comparison")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=416)
+    parser.add_argument("--calib", default=CALIB_DIR, help="calibration frame directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("capture", help="save letterboxed frames from CameraConnection")
+    p.add_argument("--frames", type=int, default=300)
+    p.add_argument("--interval", type=float, default=1.0, help="seconds between grabs")
+    p.add_argument("--timeout", type=float, default=900.0)
+    p.add_argument("--cameras", help="JSON camera setting ({'cameras': [...]}) as sent by the server")
+    p.set_defaults(func=capture)
+
+    p = sub.add_parser("build", help="build the calibration table and the INT8 model")
+    p.add_argument("--threads", type=int, default=os.cpu_count())
+    p.add_argument("--method", default="kl", choices=["kl", "aciq", "eq"])
+    p.set_defaults(func=build)
+
+    p = sub.add_parser("compare", help="latency and person-count agreement, FP vs INT8")
+    p.add_argument("--source", help="video file instead of the calibration frames")
+    p.add_argument("--frames", type=int, default=200)
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--backend", default="ncnn", choices=list(BACKENDS))
+    p.add_argument("--json", action="store_true", help="print machine-readable results")
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
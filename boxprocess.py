@@ -1,142 +1,1098 @@
 #boxprocess.py
 
-from ultralytics import YOLO
 import cv2
 import numpy as np
 import base64
-from collections import deque, defaultdict
+import math
+import os
+import threading
+import time
+from collections import deque
+
+MODEL_PATH = "model/yolo11n_ncnn_model"
+EMPTY_BOXES = np.empty((0, 6), np.float32)
+DETECT_CONF = 0.4       # detector score floor; the tracker starts tracks from here too
+
+
+def nms(boxes, scores, iou_thres):
+    """Greedy NMS over xyxy boxes; the IoU of each pick against the rest is one vector op."""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+class UltralyticsBackend:
+    """Detector driven through ultralytics `YOLO.predict()` (autobackend + torch pre/post-processing)."""
+
+    name = "ultralytics"
+
+    def __init__(self, model_path, imgsz, conf, iou, classes, num_threads=None):
+        from ultralytics import YOLO
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        self.model = YOLO(model_path, task='detect')
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.classes = classes
+        self.num_threads = num_threads
+        self._threads_applied = not num_threads
+
+    def _apply_num_threads(self):
+        # The ncnn.Net lives in the AutoBackend that the first predict() builds; every
+        # extractor copies net.opt, so setting it once covers all later frames
+        predictor = getattr(self.model, "predictor", None)
+        if predictor is None:
+            return
+        net = getattr(predictor.model, "net", None)     # None for non-ncnn exports
+        if net is not None:
+            net.opt.num_threads = self.num_threads
+        self._threads_applied = True
+
+    def infer(self, frame):
+        results = self.model.predict(
+            frame, save=False, show=False, conf=self.conf,
+            iou=self.iou, classes=self.classes, verbose=False, imgsz=self.imgsz
+        )
+        if not self._threads_applied:
+            self._apply_num_threads()
+        if not results or results[0].boxes is None or len(results[0].boxes) == 0:
+            return EMPTY_BOXES
+        boxes = results[0].boxes
+        return np.concatenate([
+            boxes.xyxy.cpu().numpy(),
+            boxes.conf.cpu().numpy()[:, None],
+            boxes.cls.cpu().numpy()[:, None],
+        ], axis=1).astype(np.float32)
+
+
+class NcnnBackend:
+    """Detector that drives the `.param/.bin` pair directly with `ncnn.Net` (no torch, no ultralytics).
+
+    The input `ncnn.Mat` is allocated once and written in place through a NumPy view;
+    letterbox, BGR->RGB, 1/255 scaling and HWC->CHW happen in a single pass per channel.
+    """
+
+    name = "ncnn"
+    PAD_VALUE = 114 / 255.0
+
+    def __init__(self, model_path, imgsz, conf, iou, classes, num_threads=None):
+        import ncnn
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.classes = np.asarray(classes, dtype=np.int64)
+
+        self.net = ncnn.Net()
+        self.net.opt.use_vulkan_compute = False
+        if num_threads:
+            self.net.opt.num_threads = num_threads
+        self.net.load_param(f"{model_path}/model.ncnn.param")
+        self.net.load_model(f"{model_path}/model.ncnn.bin")
+        self.input_name = self.net.input_names()[0]
+        self.output_name = sorted(self.net.output_names())[0]
+
+        # Reused input blob, (3, imgsz, imgsz) float32, and a writable view into it
+        self.mat_in = ncnn.Mat(imgsz, imgsz, 3)
+        self.blob = np.array(self.mat_in, copy=False)
+        self.blob[...] = self.PAD_VALUE
+        self._resized = None
+        self._layout = None     # (h, w) of the last source frame
+
+    def _letterbox_params(self, h, w):
+        gain = min(self.imgsz / h, self.imgsz / w)
+        nw, nh = int(round(w * gain)), int(round(h * gain))
+        left = int(round((self.imgsz - nw) / 2 - 0.1))
+        top = int(round((self.imgsz - nh) / 2 - 0.1))
+        return gain, nw, nh, left, top
+
+    def preprocess(self, frame):
+        h, w = frame.shape[:2]
+        gain, nw, nh, left, top = self._letterbox_params(h, w)
+        if self._layout != (h, w):
+            self.blob[...] = self.PAD_VALUE
+            self._resized = np.empty((nh, nw, 3), np.uint8)
+            self._layout = (h, w)
+        cv2.resize(frame, (nw, nh), dst=self._resized, interpolation=cv2.INTER_LINEAR)
+        for c in range(3):
+            # BGR -> RGB, /255 and HWC -> CHW straight into the ncnn input blob
+            np.multiply(self._resized[:, :, 2 - c], 1 / 255.0,
+                        out=self.blob[c, top:top + nh, left:left + nw])
+        return gain, left, top
+
+    def decode(self, out, gain, left, top, h, w):
+        # out: (4 + nc, anchors) -> cx, cy, w, h in input pixels, then per-class scores
+        scores = out[4 + self.classes]
+        best = scores.argmax(axis=0)
+        conf = scores[best, np.arange(scores.shape[1])]
+        mask = conf > self.conf
+        if not mask.any():
+            return EMPTY_BOXES
+        xywh = out[:4, mask].T
+        conf = conf[mask]
+        cls = self.classes[best[mask]]
+        xyxy = np.empty_like(xywh)
+        xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+        xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+        keep = nms(xyxy, conf, self.iou)
+        xyxy = xyxy[keep]
+        xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - left) / gain).clip(0, w)
+        xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - top) / gain).clip(0, h)
+        return np.concatenate([xyxy, conf[keep, None], cls[keep, None]], axis=1).astype(np.float32)
+
+    def infer(self, frame):
+        h, w = frame.shape[:2]
+        gain, left, top = self.preprocess(frame)
+        with self.net.create_extractor() as ex:
+            ex.input(self.input_name, self.mat_in)
+            _, out = ex.extract(self.output_name)
+        return self.decode(np.array(out), gain, left, top, h, w)
+
+
+BACKENDS = {
+    UltralyticsBackend.name: UltralyticsBackend,
+    NcnnBackend.name: NcnnBackend,
+}
+
+
+def model_path_for_size(model_path, size, base_size=416):
+    """NCNN exports have a fixed input shape; other sizes live next to the base model as `<path>_<size>`."""
+    return model_path if size == base_size else f"{model_path}_{size}"
+
+
+PRECISIONS = ("fp32", "int8")
+
+
+def model_path_for_precision(model_path, precision="fp32"):
+    """The INT8-calibrated variant lives next to the FP model as `<path>_int8` (see benchmark/int8.py).
+
+    Falls back to the FP model when the variant has not been built on this device.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {list(PRECISIONS)}")
+    if precision == "fp32":
+        return model_path
+    variant = f"{model_path}_{precision}"
+    if not os.path.isdir(variant):
+        print(f"⚠️ {variant} not found, using the FP model")
+        return model_path
+    return variant
+
+
+def available_input_sizes(model_path=MODEL_PATH, candidates=(256, 320, 416, 512), base_size=416):
+    """Candidate sizes that have an exported model on disk (the base size always counts)."""
+    return sorted({base_size} | {s for s in candidates
+                                 if os.path.isdir(model_path_for_size(model_path, s, base_size))})
+
+
+class InferenceEngine:
+    """Process-wide detector: the NCNN model is loaded once and shared by every camera.
+
+    `backend` selects how the network is driven ("ultralytics" or "ncnn").
+    Per-frame input sizes other than `imgsz` load the matching `<model_path>_<size>`
+    export on first use. `precision="int8"` loads the `<model_path>_int8` variant
+    (and its `_<size>` siblings). Detections are returned per frame as float32
+    arrays of shape (N, 6): x1, y1, x2, y2, conf, cls.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, model_path=MODEL_PATH, imgsz=416, conf=DETECT_CONF, iou=0.4, classes=(0,),
+                 backend="ultralytics", num_threads=None, precision="fp32"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}', expected one of {list(BACKENDS)}")
+        model_path = model_path_for_precision(model_path, precision)
+        self.model_path = model_path
+        self.precision = precision if model_path.endswith(f"_{precision}") else "fp32"
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.classes = list(classes)
+        self.backend_name = backend
+        self.num_threads = num_threads
+        self.backend = BACKENDS[backend](model_path, imgsz, conf, iou, self.classes, num_threads=num_threads)
+        self.backends = {imgsz: self.backend}
+        self.sizes = available_input_sizes(model_path, base_size=imgsz)
+        self._lock = threading.Lock()
+        self.load_time = 0.0        # seconds, set by shared()
+        self.warmup_time = 0.0
+        self.last_latency = 0.0     # seconds for the last batch
+        self.frame_latency = 0.0    # smoothed seconds per frame
+        self.batches = 0
+        self.frames = 0
+
+    @classmethod
+    def shared(cls, warmup=0, **kwargs):
+        """Return the process-wide engine, loading (and warming) the model on first use."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                start = time.perf_counter()
+                engine = cls(**kwargs)
+                engine.load_time = time.perf_counter() - start
+                if warmup:
+                    engine.warmup(warmup)
+                cls._shared = engine
+            return cls._shared
+
+    @classmethod
+    def preload(cls, warmup=3, **kwargs):
+        """Load and warm the shared engine in a background thread; shared() blocks until it is ready."""
+        thread = threading.Thread(target=cls.shared, kwargs=dict(warmup=warmup, **kwargs),
+                                  name="engine-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def warmup(self, runs=3, sizes=None, shape=(360, 640, 3)):
+        """Pay lazy initialization (autobackend setup, NCNN pipelines, allocator growth) up front."""
+        start = time.perf_counter()
+        dummy = np.full(shape, 114, np.uint8)
+        for size in sizes or [self.imgsz]:
+            backend = self._backend_for(size)
+            for _ in range(runs):
+                backend.infer(dummy)
+        self.warmup_time = time.perf_counter() - start
+        return self.warmup_time
+
+    def _backend_for(self, size):
+        if size is None:
+            return self.backend
+        if size not in self.backends:
+            if size not in self.sizes:
+                # no export for that size: use the closest one we have
+                size = min(self.sizes, key=lambda s: abs(s - size))
+            if size not in self.backends:
+                self.backends[size] = BACKENDS[self.backend_name](
+                    model_path_for_size(self.model_path, size, self.imgsz), size,
+                    self.conf, self.iou, self.classes, num_threads=self.num_threads)
+        return self.backends[size]
+
+    def predict(self, frames, imgsz=None):
+        """Run one batch (one tick, all cameras) and return one detection array per frame.
+
+        `imgsz` is None (engine default) or one input size per frame.
+        """
+        if not frames:
+            return []
+        sizes = imgsz if imgsz is not None else [None] * len(frames)
+        with self._lock:
+            start = time.perf_counter()
+            # The exported NCNN graph is batch=1, so the tick's batch is fed
+            # frame by frame through the single shared network.
+            out = [self._backend_for(size).infer(frame) for frame, size in zip(frames, sizes)]
+            self.last_latency = time.perf_counter() - start
+            per_frame = self.last_latency / len(frames)
+            self.frame_latency = (per_frame if self.frame_latency == 0
+                                  else 0.8 * self.frame_latency + 0.2 * per_frame)
+            self.batches += 1
+            self.frames += len(frames)
+        return out
+
+
+class InferenceScheduler:
+    """Per-camera inference cadence.
+
+    The shortest interval (in frames) is what the detector latency allows at `target_fps`
+    when this camera may spend `budget` of each frame period on inference. While people
+    are in view the scheduler stays at that floor; on empty scenes it backs off
+    exponentially up to `max_interval` and snaps back on the first detection.
+    """
+
+    def __init__(self, target_fps=15, budget=0.5, min_interval=1, max_interval=15, idle_after=3):
+        self.target_fps = target_fps
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_after = idle_after
+        self.interval = 3
+        self.idle_runs = 0
+        self.inferred = 0
+        self.dropped = 0
+        self.gated = 0          # due frames held back by the motion gate
+        self._since_last = 0
+        self._stamps = deque(maxlen=30)
+
+    def floor_interval(self, latency):
+        if latency <= 0 or self.budget <= 0:
+            return self.min_interval
+        return max(self.min_interval, math.ceil(latency * self.target_fps / self.budget))
+
+    def tick(self, gate_open=True):
+        """Called once per frame; True when this frame should go to the detector.
+
+        A closed gate (see MotionGate) holds a due frame back; the next frame with
+        the gate open is then sent immediately.
+        """
+        self._since_last += 1
+        if self._since_last >= self.interval:
+            if gate_open:
+                self._since_last = 0
+                return True
+            self.gated += 1
+        self.dropped += 1
+        return False
+
+    def observe(self, detections, latency):
+        """Feed back the detection count and per-frame detector latency of the last run."""
+        self.inferred += 1
+        self._stamps.append(time.time())
+        floor = self.floor_interval(latency)
+        if detections > 0:
+            self.idle_runs = 0
+            self.interval = floor
+            return
+        self.idle_runs += 1
+        if self.idle_runs >= self.idle_after:
+            self.interval = max(floor, min(self.max_interval, self.interval * 2))
+        else:
+            self.interval = max(floor, self.interval)
+
+    def stats(self):
+        rate = 0.0
+        if len(self._stamps) > 1:
+            span = self._stamps[-1] - self._stamps[0]
+            rate = (len(self._stamps) - 1) / span if span > 0 else 0.0
+        return {
+            "interval": self.interval,
+            "inference_fps": round(rate, 2),
+            "inferred": self.inferred,
+            "dropped": self.dropped,
+            "gated": self.gated,
+        }
+
+
+class MotionGate:
+    """Cheap change detector that keeps the network idle while the zones are static.
+
+    Frames are downscaled by `scale`, converted to grayscale and compared against a
+    running background. Only pixels inside the configured polygons (grown by `margin`
+    frame pixels) are considered; with no polygons the whole view is watched. The gate
+    opens on motion or once `keepalive` seconds have passed since the last detector run.
+    """
+
+    def __init__(self, width, height, scale=0.25, threshold=25, min_changed=0.002,
+                 margin=20, keepalive=5.0, learning_rate=0.05):
+        self.scale = scale
+        self.size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        self.threshold = threshold
+        self.min_changed = min_changed
+        self.margin = margin
+        self.keepalive = keepalive
+        self.learning_rate = learning_rate
+        self.mask = None            # uint8 low-res zone mask, None = whole frame
+        self.mask_area = self.size[0] * self.size[1]
+        self.background = None      # float32 running background
+        self.pending = True         # motion seen since the last detector run
+        self.last_run = 0.0
+        self.last_motion = 0.0
+        self.motion_frames = 0
+        self._zones_key = None
+
+    def set_zones(self, coords_list):
+        """Rebuild the zone mask, only when the polygon coordinates actually changed."""
+        key = tuple(tuple(map(tuple, c)) for c in coords_list if c)
+        if key == self._zones_key:
+            return
+        self._zones_key = key
+        if not key:
+            self.mask = None
+            self.mask_area = self.size[0] * self.size[1]
+            return
+        mask = np.zeros((self.size[1], self.size[0]), np.uint8)
+        for coord in key:
+            pts = np.round(np.array(coord, np.float32) * self.scale).astype(np.int32)
+            cv2.fillPoly(mask, [pts], 255)
+        grow = max(1, int(round(self.margin * self.scale)))
+        mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * grow + 1, 2 * grow + 1)))
+        self.mask = mask
+        self.mask_area = max(1, cv2.countNonZero(mask))
+        self.pending = True
+
+    def update(self, img):
+        """Fold one frame into the background; returns True when the zones changed."""
+        small = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.pending = True
+            self.last_motion = time.time()
+            return True
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        _, changed = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        if self.mask is not None:
+            changed = cv2.bitwise_and(changed, self.mask)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        motion = cv2.countNonZero(changed) >= self.min_changed * self.mask_area
+        if motion:
+            self.motion_frames += 1
+            self.pending = True
+            self.last_motion = time.time()
+        return motion
+
+    def is_open(self):
+        return self.pending or time.time() - self.last_run >= self.keepalive
+
+    def mark_run(self, started=None):
+        """A detector run on a frame taken at `started` (default now) has been delivered.
+
+        Motion seen after that frame was taken stays pending: the run did not cover it.
+        """
+        started = time.time() if started is None else started
+        self.pending = self.last_motion > started
+        self.last_run = max(self.last_run, started)
+
+
+class InputSizeSelector:
+    """Per-camera detector input size driven by observed person heights and the zone size.
+
+    The goal is the smallest size at which the small people in view (10th percentile of
+    recent box heights) are still at least `min_person_px` tall on the network input.
+    Sizes above what the input region itself needs are never chosen. Stepping up is
+    immediate; stepping down needs `headroom` to spare for `patience` detector runs in
+    a row and moves one size at a time, so the choice does not flap.
+    """
+
+    def __init__(self, sizes=(256, 320, 416, 512), initial=416, min_person_px=32,
+                 headroom=1.25, window=30, patience=10):
+        self.sizes = sorted(sizes)
+        self.size = initial if initial in self.sizes else self.sizes[-1]
+        self.min_person_px = min_person_px
+        self.headroom = headroom
+        self.patience = patience
+        self.heights = deque(maxlen=window)
+        self.switches = 0
+        self._down_votes = 0
+
+    def observe(self, detections, input_long):
+        """Feed one detector run; `input_long` is the long side of the detector input in frame px."""
+        if len(detections) == 0 or input_long <= 0:
+            return self.size
+        self.heights.extend((detections[:, 3] - detections[:, 1]).tolist())
+        small = max(1.0, float(np.percentile(self.heights, 10)))
+        need = self.min_person_px * input_long / small
+        cap = next((s for s in self.sizes if s >= input_long), self.sizes[-1])
+        want = min(next((s for s in self.sizes if s >= need), self.sizes[-1]), cap)
+
+        idx = self.sizes.index(self.size)
+        if want > self.size:
+            self.size = want
+            self.switches += 1
+            self._down_votes = 0
+        elif want < self.size and idx > 0 and need * self.headroom <= self.sizes[idx - 1]:
+            self._down_votes += 1
+            if self._down_votes >= self.patience:
+                self.size = self.sizes[idx - 1]
+                self.switches += 1
+                self._down_votes = 0
+        else:
+            self._down_votes = 0
+        return self.size
+
+    def stats(self):
+        return {"imgsz": self.size, "switches": self.switches}
+
+
+class BoxPropagator:
+    """Moves the last detections forward on frames the detector skipped.
+
+    mode "none"     - reuse the last boxes unchanged (previous behavior)
+    mode "velocity" - constant-velocity model; each box keeps the speed of its nearest
+                      match in the previous detector run (px/s, vectorized matching)
+    mode "flow"     - sparse Lucas-Kanade optical flow on a few points per box, each box
+                      shifted by the median motion of its points
+    """
+
+    MODES = ("none", "velocity", "flow")
+
+    def __init__(self, mode="none", max_jump=80.0, max_dt=1.0, flow_scale=0.5, points_per_box=9):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown propagation mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        self.max_jump = max_jump            # px between runs to still count as the same person
+        self.max_dt = max_dt                # seconds of extrapolation before boxes freeze
+        self.flow_scale = flow_scale
+        self.points_per_box = points_per_box
+        self._lock = threading.Lock()
+        self.boxes = None                   # (N, 6) last detections
+        self.velocity = None                # (N, 2) px/s
+        self.stamp = 0.0
+        # flow state
+        self._prev_gray = None
+        self._seed = None                   # (N * P, 2) float32 points at detection time
+        self._points = None                 # (N * P, 2) points tracked to the last frame
+        self._alive = None                  # (N * P,) bool
+        self._needs_seed = False
+        # stats
+        self.propagated = 0
+        self.total_shift = 0.0
+
+    def reset(self, detections):
+        """New detector output arrived."""
+        now = time.time()
+        with self._lock:
+            velocity = np.zeros((len(detections), 2), np.float32)
+            if self.mode == "velocity" and self.boxes is not None and len(self.boxes) and len(detections):
+                dt = now - self.stamp
+                if dt > 0:
+                    new_c = (detections[:, :2] + detections[:, 2:4]) / 2
+                    old_c = (self.boxes[:, :2] + self.boxes[:, 2:4]) / 2
+                    dist = np.linalg.norm(new_c[:, None, :] - old_c[None, :, :], axis=2)
+                    nearest = dist.argmin(axis=1)
+                    matched = dist[np.arange(len(new_c)), nearest] <= self.max_jump
+                    velocity[matched] = (new_c[matched] - old_c[nearest[matched]]) / dt
+            self.boxes = detections
+            self.velocity = velocity
+            self.stamp = now
+            self._needs_seed = self.mode == "flow"
+
+    def _seed_points(self, boxes):
+        # P points on a grid over the lower two thirds of each box (torso and legs)
+        g = int(round(np.sqrt(self.points_per_box)))
+        fx = (np.arange(g) + 0.5) / g
+        fy = 1 / 3 + (np.arange(g) + 0.5) / g * 2 / 3
+        gx, gy = np.meshgrid(fx, fy)
+        w = boxes[:, 2] - boxes[:, 0]
+        h = boxes[:, 3] - boxes[:, 1]
+        px = boxes[:, 0, None] + w[:, None] * gx.ravel()[None, :]
+        py = boxes[:, 1, None] + h[:, None] * gy.ravel()[None, :]
+        return np.stack([px.ravel(), py.ravel()], axis=1).astype(np.float32) * self.flow_scale
+
+    def _flow(self, img):
+        small = cv2.resize(img, None, fx=self.flow_scale, fy=self.flow_scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        boxes = self.boxes
+        if self._needs_seed or self._prev_gray is None or self._prev_gray.shape != gray.shape:
+            self._seed = self._seed_points(boxes)
+            self._points = self._seed.copy()
+            self._alive = np.ones(len(self._seed), bool)
+            self._prev_gray = gray
+            self._needs_seed = False
+            return boxes
+        if len(self._points):
+            nxt, status, _ = cv2.calcOpticalFlowPyrLK(
+                self._prev_gray, gray, self._points.reshape(-1, 1, 2), None,
+                winSize=(15, 15), maxLevel=2)
+            self._points = nxt.reshape(-1, 2)
+            self._alive &= status.ravel().astype(bool)
+        self._prev_gray = gray
+        per_box = len(self._seed) // len(boxes)
+        disp = ((self._points - self._seed) / self.flow_scale).reshape(len(boxes), per_box, 2)
+        alive = self._alive.reshape(len(boxes), per_box)
+        disp = np.where(alive[:, :, None], disp, np.nan)
+        with np.errstate(all="ignore"):
+            shift = np.nan_to_num(np.nanmedian(disp, axis=1))
+        out = boxes.copy()
+        out[:, [0, 2]] += shift[:, 0:1]
+        out[:, [1, 3]] += shift[:, 1:2]
+        return out
+
+    def advance(self, img):
+        """Boxes for the current frame."""
+        with self._lock:
+            boxes = self.boxes
+            if boxes is None or len(boxes) == 0 or self.mode == "none":
+                return boxes
+            if self.mode == "velocity":
+                dt = min(time.time() - self.stamp, self.max_dt)
+                step = self.velocity * dt
+                out = boxes.copy()
+                out[:, [0, 2]] += step[:, 0:1]
+                out[:, [1, 3]] += step[:, 1:2]
+            else:
+                out = self._flow(img)
+            self.propagated += 1
+            self.total_shift += float(np.abs(out[:, :2] - boxes[:, :2]).mean())
+        return out
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "propagated": self.propagated,
+            "mean_shift_px": round(self.total_shift / self.propagated, 2) if self.propagated else 0.0,
+        }
+
+
+# stroke / fill colour per zone, cycled
+ZONE_COLORS = [((0, 255, 0), (0, 255, 0, 25)), ((255, 255, 0), (255, 255, 0, 25)),
+               ((255, 0, 255), (255, 0, 255, 25)), ((0, 165, 255), (0, 165, 255, 25)),
+               ((255, 128, 0), (255, 128, 0, 25)), ((0, 255, 255), (0, 255, 255, 25))]
+
+
+def footprints(boxes):
+    """Foot region of each box (N, 4): x1, y1, x2, y2 of the centred half-width, bottom-22% strip."""
+    b = np.asarray(boxes, np.float32)[:, :4]
+    out = np.empty_like(b)
+    half = (b[:, 2] - b[:, 0]) * 0.25
+    cx = (b[:, 0] + b[:, 2]) * 0.5
+    out[:, 0] = cx - half
+    out[:, 1] = b[:, 3] - (b[:, 3] - b[:, 1]) * 0.22
+    out[:, 2] = cx + half
+    out[:, 3] = b[:, 3]
+    return out
+
+
+class ZoneMasks:
+    """Zones rasterized once per polygon version into one label mask at frame resolution.
+
+    Bit `i` of `labels[y, x]` is set when pixel (x, y) lies in zone `i` (up to MAX_ZONES
+    overlapping zones), so testing every footprint point of every box against every zone
+    is a single NumPy gather whatever the zone count. Zone vertices go into a uniform grid
+    plus a vertex-count integral image: a box is only checked against the vertices of the
+    cells its footprint touches, and only when the integral says there is one. Recompiled
+    only when the coordinates change.
+    """
+
+    MAX_ZONES = 64
+    CELL = 32               # grid cell size in pixels for the vertex index
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.labels = None
+        self.points = []        # int32 (V, 2) per zone for drawing, None for empty zones
+        self.bboxes = []        # (x1, y1, x2, y2) per zone, None for empty zones
+        self.version = 0
+        self._flat = None       # labels.ravel(), for flat-index lookups
+        self._verts = np.zeros((0, 2), np.float32)  # all zone vertices ...
+        self._vert_bits = np.zeros(0, np.uint64)    # ... and the zone bit each belongs to
+        self._vert_integral = None                  # (H+1, W+1) vertex counts
+        self._grid = {}                             # (gx, gy) -> vertex indices
+        self._shifts = np.zeros(0, np.uint64)
+        self._key = None
+
+    def compile(self, coords_list):
+        """Rebuild the mask if the zones changed; returns True when it did."""
+        key = tuple(tuple(map(tuple, c)) if c else () for c in coords_list)
+        if key == self._key:
+            return False
+        if len(coords_list) > self.MAX_ZONES:
+            raise ValueError(f"At most {self.MAX_ZONES} zones per camera, got {len(coords_list)}")
+        self._key = key
+        n = len(coords_list)
+        dtype = np.uint8 if n <= 8 else np.uint16 if n <= 16 else np.uint32 if n <= 32 else np.uint64
+        self.labels = np.zeros((self.height, self.width), dtype)
+        self.points, self.bboxes = [], []
+        verts, vert_bits = [], []
+        layer = np.zeros((self.height, self.width), np.uint8)
+        for i, coord in enumerate(coords_list):
+            if not coord:
+                self.points.append(None)
+                self.bboxes.append(None)
+                continue
+            v = np.asarray(coord, np.float32).reshape(-1, 2)
+            pts = v.astype(np.int32)
+            x, y, w, h = cv2.boundingRect(pts)
+            # rasterize inside the zone's bounding box only; cost scales with zone area, not frame area
+            x1, y1 = max(0, x - 1), max(0, y - 1)
+            x2, y2 = min(self.width, x + w + 1), min(self.height, y + h + 1)
+            if x2 > x1 and y2 > y1:
+                roi = layer[y1:y2, x1:x2]
+                roi[:] = 0
+                cv2.fillPoly(roi, [pts], 1, offset=(-x1, -y1))
+                cv2.polylines(roi, [pts - (x1, y1)], True, 1, 1)   # boundary counts as inside, like pointPolygonTest
+                self.labels[y1:y2, x1:x2] |= roi.astype(dtype) << dtype(i)
+            self.points.append(pts)
+            self.bboxes.append((x, y, x + w, y + h))
+            verts.append(v)
+            vert_bits.append(np.full(len(v), 1 << i, np.uint64))
+        self._flat = self.labels.ravel()
+        self._verts = np.concatenate(verts) if verts else np.zeros((0, 2), np.float32)
+        self._vert_bits = np.concatenate(vert_bits) if vert_bits else np.zeros(0, np.uint64)
+        self._shifts = np.arange(n, dtype=np.uint64)
+
+        # vertex index: counts per pixel (integral image) and vertex ids per grid cell
+        vx = np.clip(np.floor(self._verts[:, 0]), 0, self.width - 1).astype(np.intp)
+        vy = np.clip(np.floor(self._verts[:, 1]), 0, self.height - 1).astype(np.intp)
+        counts = np.zeros((self.height, self.width), np.int32)
+        np.add.at(counts, (vy, vx), 1)
+        self._vert_integral = np.pad(counts.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        self._grid = {}
+        for k, cell in enumerate(zip(vx // self.CELL, vy // self.CELL)):
+            self._grid.setdefault(cell, []).append(k)
+        self._grid = {cell: np.asarray(ids, np.intp) for cell, ids in self._grid.items()}
+        self.version += 1
+        return True
+
+    def _vertex_bits(self, f):
+        """Zone bits of the vertices lying in each footprint; only footprints whose pixel range
+        holds a vertex (integral image) are looked up in the grid."""
+        bits = np.zeros(len(f), np.uint64)
+        if not len(self._verts):
+            return bits
+        x1 = np.clip(np.floor(f[:, 0]), 0, self.width - 1).astype(np.intp)
+        y1 = np.clip(np.floor(f[:, 1]), 0, self.height - 1).astype(np.intp)
+        x2 = np.clip(np.floor(f[:, 2]), 0, self.width - 1).astype(np.intp) + 1
+        y2 = np.clip(np.floor(f[:, 3]), 0, self.height - 1).astype(np.intp) + 1
+        ii = self._vert_integral
+        present = ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]
+        for k in np.flatnonzero(present):
+            gx1, gx2 = x1[k] // self.CELL, (x2[k] - 1) // self.CELL
+            gy1, gy2 = y1[k] // self.CELL, (y2[k] - 1) // self.CELL
+            ids = [self._grid[c] for c in ((gx, gy) for gx in range(gx1, gx2 + 1)
+                                           for gy in range(gy1, gy2 + 1)) if c in self._grid]
+            if not ids:
+                continue
+            ids = np.concatenate(ids)
+            v = self._verts[ids]
+            hit = ((v[:, 0] >= f[k, 0]) & (v[:, 0] <= f[k, 2]) &
+                   (v[:, 1] >= f[k, 1]) & (v[:, 1] <= f[k, 3]))
+            if hit.any():
+                bits[k] = np.bitwise_or.reduce(self._vert_bits[ids[hit]])
+        return bits
+
+    def membership(self, boxes):
+        """Zone bitmask per box: a footprint corner or its bottom-centre lies in the zone, or a zone
+        vertex lies in the footprint."""
+        n = len(boxes)
+        if n == 0 or self._flat is None:
+            return np.zeros(n, np.uint64)
+        f = footprints(boxes)
+        px = f[:, [0, 2, 0, 2, 0]]
+        px[:, 4] = (f[:, 0] + f[:, 2]) * 0.5
+        py = f[:, [1, 1, 3, 3, 3]]
+        # points past the border (y2 == height is common) read the edge pixel, so zones drawn
+        # to the image border still catch boxes that touch it
+        ix = np.clip(np.rint(px), 0, self.width - 1).astype(np.intp)
+        iy = np.clip(np.rint(py), 0, self.height - 1).astype(np.intp)
+        idx = iy * self.width + ix
+        bits = np.bitwise_or.reduce(self._flat[idx], axis=1).astype(np.uint64)
+        return bits | self._vertex_bits(f)
+
+    def counts(self, bits):
+        """(N, Z) boolean membership matrix from the per-box bitmasks."""
+        return ((bits[:, None] >> self._shifts) & np.uint64(1)).astype(bool)
+
+
+def merge_rects(rects):
+    """Merge overlapping (x1, y1, x2, y2) rectangles until they are pairwise disjoint."""
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(r) for r in rects]
+
+
+class ZoneOverlay:
+    """Static zone layer (translucent fill + outline) rendered once per ZoneMasks version.
+
+    Per frame only the zones' bounding rectangles are touched: one addWeighted per weight
+    (0.3 fill over the image, 0.7 outline over the image) and masked copies, instead of
+    copying and blending the whole frame. Same pixels as the previous full-frame
+    `addWeighted(overlay, 0.3, frame, 0.7)` with the outline drawn under it.
+    """
+
+    FILL_ALPHA = 0.3
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.version = None
+        self.rects = []         # [(x1, y1, x2, y2, layer, fill_mask, stroke_mask, solid, solid_mask), ...]
+
+    def compile(self, zone_masks, colors):
+        if zone_masks.version == self.version:
+            return
+        self.version = zone_masks.version
+        a = self.FILL_ALPHA
+        fill = np.zeros((self.height, self.width, 3), np.uint8)
+        fill_mask = np.zeros((self.height, self.width), np.uint8)
+        stroke = np.zeros((self.height, self.width, 3), np.uint8)
+        stroke_mask = np.zeros((self.height, self.width), np.uint8)
+        boxes = []
+        for i, pts in enumerate(zone_masks.points):
+            if pts is None:
+                continue
+            stroke_color, fill_color = colors[i % len(colors)]
+            cv2.fillPoly(fill, [pts], fill_color[:3])
+            cv2.fillPoly(fill_mask, [pts], 1)
+            cv2.polylines(stroke, [pts], True, stroke_color, 2)
+            cv2.polylines(stroke_mask, [pts], True, 1, 2)
+            x, y, w, h = cv2.boundingRect(pts)
+            boxes.append((max(0, x - 2), max(0, y - 2), min(self.width, x + w + 2), min(self.height, y + h + 2)))
+        self.rects = []
+        for x1, y1, x2, y2 in merge_rects(boxes):
+            if x2 <= x1 or y2 <= y1:
+                continue
+            fm, sm = fill_mask[y1:y2, x1:x2], stroke_mask[y1:y2, x1:x2]
+            fc, sc = fill[y1:y2, x1:x2], stroke[y1:y2, x1:x2]
+            # fill pixels blend the image at 0.3, outline pixels outside the fill at 0.7,
+            # outline pixels over the fill do not depend on the image at all
+            layer = np.where(sm[..., None] > 0, sc, fc)
+            solid = cv2.addWeighted(fc, a, sc, 1 - a, 0)
+            self.rects.append((x1, y1, x2, y2, layer, fm & (sm ^ 1), sm & (fm ^ 1), solid, sm & fm))
+
+    def apply(self, frame):
+        """Composite the cached layer into `frame` in place."""
+        a = self.FILL_ALPHA
+        for x1, y1, x2, y2, layer, fill_mask, stroke_mask, solid, solid_mask in self.rects:
+            roi = frame[y1:y2, x1:x2]
+            cv2.copyTo(cv2.addWeighted(layer, a, roi, 1 - a, 0), fill_mask, roi)
+            cv2.copyTo(cv2.addWeighted(layer, 1 - a, roi, a, 0), stroke_mask, roi)
+            cv2.copyTo(solid, solid_mask, roi)
+        return frame
+
 
 class ModelboxProcess:
-    def __init__(self, WIDTH, HEIGHT, value: list = None, polygons=None) -> None:
+    def __init__(self, WIDTH, HEIGHT, value: list = None, polygons=None, engine=None, scheduler=None,
+                 motion_gate=None, zone_crop=False, crop_margin=32, propagator=None, tracker=None,
+                 size_selector=None, max_zones=ZoneMasks.MAX_ZONES, line_counter=None, dwell=None,
+                 heatmap=None) -> None:
         self.WIDTH = WIDTH
         self.HEIGHT = HEIGHT
+        self.dwell = dwell      # optional zone_analytics.DwellTracker, needs the tracker's IDs
+        self.heatmap = heatmap  # optional heatmap.OccupancyHeatmap fed with every frame's boxes
         self.polygons = []
+        self.max_zones = min(max_zones, ZoneMasks.MAX_ZONES)
+        self.motion_gate = motion_gate      # optional MotionGate, None = always run on schedule
 
-        if polygons:
-            self.set_polygons(polygons)
+        # Zone-cropped inference: detector sees only the polygons' bounding region
+        self.zone_crop = zone_crop
+        self.crop_margin = crop_margin
+        self.crop_rect = None               # (x1, y1, x2, y2) in frame pixels, None = full frame
+        self._crop_key = None
 
-        self.model = YOLO("model/yolo11n_ncnn_model", task='detect')
+        self._lock = threading.Lock()       # zone / line state vs. the render threads
+        self.zone_masks = ZoneMasks(WIDTH, HEIGHT)
+        self.zone_overlay = ZoneOverlay(WIDTH, HEIGHT)
+        self.box_zones = np.zeros(0, np.uint64)     # zone bitmask per box of the last counted frame
+        self.set_polygons(polygons or [])     # area1 / area2 compiled even before zones arrive
+
+        self.engine = engine if engine is not None else InferenceEngine.shared()
+        self.scheduler = scheduler if scheduler is not None else InferenceScheduler()
+        self.propagator = propagator if propagator is not None else BoxPropagator()
+        self.tracker = tracker      # optional ByteTracker; when set it supplies boxes and IDs every frame
+        self.size_selector = size_selector  # optional InputSizeSelector, None = engine default size
+        self.line_counter = line_counter    # optional LineCrossingCounter, needs the tracker's IDs
         self.detection_buffer = deque(maxlen=20)
-        self.track_history = defaultdict(list)
-        self.tracked_objects = {}
         self.region_counts = {"in": 0, "out": 0}
-        self.polygon_counts = [0, 0]
+        self.polygon_counts = [0] * max(2, len(self.polygons))
+        self.zone_track_ids = [[] for _ in self.polygon_counts]
 
-        # Frame skipping logic
+        # Frame skipping is decided by self.scheduler
         self.frame_count = 0
-        self.last_results = None   # cache last YOLO result
+        self.last_boxes = None   # cache last detections (N, 6)
+        self.last_ids = None     # track IDs matching the boxes of the last processed frame
 
     def set_polygons(self, polygons):
-        normalized = []
-        for i, poly in enumerate(polygons[:2]):
-            if isinstance(poly, dict):
-                coord = poly.get("coord", [])
-                name = poly.get("name", f"Polygon-{i+1}")
-            else:
-                coord = poly
-                name = f"Polygon-{i+1}"
-            normalized.append({"coord": coord, "seen": 0, "name": name})
-        while len(normalized) < 2:
-            normalized.append({"coord": [], "seen": 0, "name": ""})
-        self.polygons = normalized
-
-    def count_objects_in_polygons(self, results):
-        self.polygon_counts = [0, 0]
-        if not results or results[0].boxes is None:
+        # the control loop swaps zones while render threads are counting: one frame at a time
+        with self._lock:
+            normalized = []
+            for i, poly in enumerate(polygons[:self.max_zones]):
+                if isinstance(poly, dict):
+                    coord = poly.get("coord", [])
+                    name = poly.get("name", f"Polygon-{i+1}")
+                else:
+                    coord = poly
+                    name = f"Polygon-{i+1}"
+                normalized.append({"coord": coord, "seen": 0, "name": name})
+            while len(normalized) < 2:       # area1/area2 always exist for the MQTT sensor mapping
+                normalized.append({"coord": [], "seen": 0, "name": ""})
+            if [(p["coord"], p["name"]) for p in normalized] == [(p["coord"], p["name"]) for p in self.polygons]:
+                return      # same zones as before: keep masks, gate and counts
+            self.polygons = normalized
+            self.polygon_counts = [0] * len(normalized)
+            self.zone_track_ids = [[] for _ in normalized]
+            if self.dwell is not None:
+                self.dwell.reset(len(normalized))
+            self.zone_masks.compile([p["coord"] for p in normalized])
+            if self.motion_gate is not None:
+                self.motion_gate.set_zones([p["coord"] for p in normalized])
+            self._update_crop_rect()
+
+    def set_lines(self, lines):
+        if self.line_counter is not None:
+            with self._lock:
+                self.line_counter.set_lines(lines or [])
+
+    def dwell_stats(self):
+        """Dwell statistics per zone, [] when dwell tracking is off."""
+        if self.dwell is None:
+            return []
+        with self._lock:
+            return self.dwell.stats()
+
+    def line_totals(self):
+        """In/out totals per counting line, [] when line counting is off."""
+        if self.line_counter is None:
+            return []
+        with self._lock:
+            return self.line_counter.totals()
+
+    def _update_crop_rect(self, max_area_ratio=0.8):
+        """Union bounding rectangle of all polygons plus `crop_margin`, clipped to the frame.
+
+        Left as None (full frame) when there are no zones or the crop would save little.
+        """
+        coords = [c for c in (p["coord"] for p in self.polygons) if c]
+        key = tuple(tuple(map(tuple, c)) for c in coords)
+        if key == self._crop_key:
             return
-        boxes = results[0].boxes.xyxy.cpu().numpy()
-        for box in boxes:
-            x1, y1, x2, y2 = map(float, box)
-            width = x2 - x1
-            height = y2 - y1
-            center_x = (x1 + x2) / 2
-            ratio = 0.25
-            v_ratio = 0.22
-            new_x1 = center_x - width * ratio
-            new_x2 = center_x + width * ratio
-            new_y1 = y2 - height * v_ratio
-            cx = (new_x1 + new_x2) / 2
-            cy = y2
-            points_to_check = [(new_x1, new_y1), (new_x2, new_y1), (new_x1, y2), (new_x2, y2), (cx, cy)]
-            for i, poly in enumerate(self.polygons[:2]):
-                if not poly["coord"]:
-                    continue
-                pts = np.array(poly["coord"], np.int32).reshape((-1, 1, 2))
-                overlap = False
-                for pt in points_to_check:
-                    if cv2.pointPolygonTest(pts, pt, False) >= 0:
-                        overlap = True
-                        break
-                if not overlap:
-                    for (px, py) in poly["coord"]:
-                        if new_x1 <= px <= new_x2 and new_y1 <= py <= y2:
-                            overlap = True
-                            break
-                if overlap:
-                    self.polygon_counts[i] += 1
-            for i, count in enumerate(self.polygon_counts):
-                self.polygons[i]["seen"] = count
+        self._crop_key = key
+        self.crop_rect = None
+        if not coords:
+            return
+        pts = np.concatenate([np.asarray(c, np.float32).reshape(-1, 2) for c in coords])
+        x1 = int(max(0, np.floor(pts[:, 0].min()) - self.crop_margin))
+        y1 = int(max(0, np.floor(pts[:, 1].min()) - self.crop_margin))
+        x2 = int(min(self.WIDTH, np.ceil(pts[:, 0].max()) + self.crop_margin))
+        y2 = int(min(self.HEIGHT, np.ceil(pts[:, 1].max()) + self.crop_margin))
+        if x2 <= x1 or y2 <= y1:
+            return
+        if (x2 - x1) * (y2 - y1) > max_area_ratio * self.WIDTH * self.HEIGHT:
+            return
+        self.crop_rect = (x1, y1, x2, y2)
 
-    def __call__(self, img, show_regions=True, show_boxes=True):
+    def input_size(self):
+        """Detector input size for this camera, None for the engine default."""
+        return self.size_selector.size if self.size_selector is not None else None
+
+    def detector_input(self, img):
+        """(image, offset) handed to the detector: the zones' crop and its origin, or the whole frame."""
+        if not self.zone_crop or self.crop_rect is None:
+            return img, (0, 0)
+        x1, y1, x2, y2 = self.crop_rect
+        return img[y1:y2, x1:x2], (x1, y1)
+
+    def count_objects_in_polygons(self, boxes, ids=None):
+        zones = len(self.polygons)
+        self.polygon_counts = [0] * zones
+        self.zone_track_ids = [[] for _ in range(zones)]   # track IDs inside each zone (when a tracker is used)
+        if boxes is None:
+            return
+        self.box_zones = bits = self.zone_masks.membership(boxes)
+        inside = self.zone_masks.counts(bits)
+        self.polygon_counts = inside.sum(axis=0).tolist()
+        if ids is not None and len(bits):
+            ids = np.asarray(ids)
+            for i in np.flatnonzero(self.polygon_counts):
+                self.zone_track_ids[i] = ids[inside[:, i]].astype(int).tolist()
+        for poly, count in zip(self.polygons, self.polygon_counts):
+            poly["seen"] = count
+
+    def should_infer(self, img=None):
+        """Advance the frame counter and report whether this frame goes to the detector.
+
+        Only the pacing is decided here; the gate and the run statistics are settled by
+        deliver(), so a request that never reaches the detector leaves no trace.
+        """
         self.frame_count += 1
-        origin_img = img.copy()
+        if self.motion_gate is None or img is None:
+            return self.scheduler.tick()
+        self.motion_gate.update(img)
+        return self.scheduler.tick(self.motion_gate.is_open())
+
+    def __call__(self, img, show_regions=True, show_boxes=True):
+        if self.should_infer(img):
+            started = time.time()
+            view, offset = self.detector_input(img)
+            self.deliver(self.engine.predict([view], [self.input_size()])[0], offset, started)
+        return self.process(img, None, show_regions, show_boxes)
+
+    def deliver(self, detections, offset=(0, 0), started=None):
+        """Accept detector output for this camera; `offset` is the crop origin from detector_input,
+        `started` the time the frame was sent (default now).
 
-        # Run YOLO only on every 3rd frame
-        if self.frame_count % 3 == 0:
-            self.last_results = self.model.predict(
-                origin_img, save=False, show=False, conf=0.4,
-                iou=0.4, classes=[0], verbose=False, imgsz=416, half=True
-            )
+        Safe to call from the inference stage while another thread renders this camera.
+        """
+        ox, oy = offset
+        if (ox or oy) and len(detections):
+            # map boxes from crop back to frame coordinates
+            detections = detections.copy()
+            detections[:, [0, 2]] += ox
+            detections[:, [1, 3]] += oy
+        self.last_boxes = detections
+        if self.size_selector is not None:
+            if self.zone_crop and self.crop_rect is not None:
+                x1, y1, x2, y2 = self.crop_rect
+                input_long = max(x2 - x1, y2 - y1)
+            else:
+                input_long = max(self.WIDTH, self.HEIGHT)
+            self.size_selector.observe(detections, input_long)
+        if self.tracker is not None:
+            self.tracker.update(detections)
+        else:
+            self.propagator.reset(detections)
+        self.scheduler.observe(len(detections), self.engine.frame_latency)
+        if self.motion_gate is not None:
+            self.motion_gate.mark_run(started)
+
+    def process(self, img, detections=None, show_regions=True, show_boxes=True):
+        """Count and render one frame; `detections` is None on skipped frames."""
+        if detections is not None:
+            self.deliver(detections)
+        # zones and lines only change between frames (set_polygons / set_lines take the same lock)
+        with self._lock:
+            return self._process(img, show_regions, show_boxes)
 
-        results = self.last_results
-        detected = origin_img.copy()
+    def _process(self, img, show_regions, show_boxes):
 
-        if results:
-            self.count_objects_in_polygons(results)
+        # skipped frames: last detections moved forward by the tracker or the propagator
+        if self.tracker is not None:
+            boxes, track_ids = self.tracker.step()
+        else:
+            boxes, track_ids = self.propagator.advance(img), None
+        self.last_ids = track_ids
 
+        if boxes is not None:
+            self.count_objects_in_polygons(boxes, track_ids)
+        if self.line_counter is not None and track_ids is not None:
+            self.line_counter.update(boxes, track_ids)
+        if self.dwell is not None and track_ids is not None:
+            self.dwell.update(track_ids, self.zone_masks.counts(self.box_zones))
+        if self.heatmap is not None:
+            self.heatmap.update(boxes, img)
+
+        if not (show_regions or show_boxes):
+            return img, self.polygon_counts     # nobody looks at this frame: counts only
+        detected = img.copy()
         if show_regions and self.polygons:
-            overlay = detected.copy()
-            colors = [((0, 255, 0), (0, 255, 0, 25)), ((255, 255, 0), (255, 255, 0, 25))]
-            for i, poly in enumerate(self.polygons[:2]):
-                if not poly["coord"]:
+            self.zone_overlay.compile(self.zone_masks, ZONE_COLORS)
+            self.zone_overlay.apply(detected)
+            for i, poly in enumerate(self.polygons):
+                pts = self.zone_masks.points[i]
+                if pts is None:
                     continue
-                pts = np.array(poly["coord"], np.int32)
-                stroke_color, fill_color = colors[i % len(colors)]
-                cv2.polylines(detected, [pts], True, stroke_color, 2)
-                cv2.fillPoly(overlay, [pts], fill_color[:3])
                 x, y = int(pts[0][0]), int(pts[0][1])
                 cv2.putText(detected, f"{poly['name']}: {poly['seen']}",
-                            (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, stroke_color, 2)
-            detected = cv2.addWeighted(overlay, 0.3, detected, 0.7, 0)
-
-        if show_boxes and results and len(results) > 0 and results[0].boxes is not None:
-            boxes = results[0].boxes.xyxy.cpu().numpy()
-            track_ids = (results[0].boxes.id.int().cpu().tolist()
-                         if results[0].boxes.id is not None else [None] * len(boxes))
-            for box, tid in zip(boxes, track_ids):
-                x1, y1, x2, y2 = map(int, box)
-                center_x = int((x1 + x2) / 2)
-                width, height = x2 - x1, y2 - y1
-                new_x1 = int(center_x - width * 0.25)
-                new_x2 = int(center_x + width * 0.25)
-                new_y1 = int(y2 - height * 0.22)
-                inside_any = False
-                for poly in self.polygons[:2]:
-                    if not poly["coord"]:
-                        continue
-                    pts = np.array(poly["coord"], np.int32)
-                    for pt in [(new_x1, new_y1), (new_x2, new_y1), (new_x1, y2), (new_x2, y2)]:
-                        if cv2.pointPolygonTest(pts, pt, False) >= 0:
-                            inside_any = True
-                            break
-                    if inside_any:
-                        break
+                            (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, ZONE_COLORS[i % len(ZONE_COLORS)][0], 2)
+        if show_regions and self.line_counter is not None:
+            self.line_counter.draw(detected)
+
+        if show_boxes and boxes is not None and len(boxes) > 0:
+            if track_ids is None:
+                track_ids = [None] * len(boxes)
+            feet = footprints(boxes).astype(np.int32)
+            for (new_x1, new_y1, new_x2, y2), tid, zones in zip(feet, track_ids, self.box_zones):
+                inside_any = bool(zones)
                 color = (0, 0, 255) if inside_any else (255, 255, 255)
-                cv2.rectangle(detected, (new_x1, new_y1), (new_x2, y2), color, 2)
+                cv2.rectangle(detected, (int(new_x1), int(new_y1)), (int(new_x2), int(y2)), color, 2)
                 label = f"ID {tid}" if tid is not None else "obj"
                 if inside_any:
                     label += " ✅"
-                cv2.putText(detected, label, (new_x1, new_y1 - 5),
+                cv2.putText(detected, label, (int(new_x1), int(new_y1) - 5),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
 
         # print(self.polygon_counts)
@@ -145,7 +1101,6 @@ class ModelboxProcess:
     def capture_image(self, frame: np.ndarray, fmt: str = ".jpg", quality: int = 85, as_base64: bool = False):
         if frame is None:
             return None
-        frame = frame.copy()
         params = []
         ext = fmt.lower()
         if ext in [".jpg", ".jpeg"]:
@@ -4,19 +4,137 @@ import numpy as np
 import time
 import math
 import os
+import sys
 import threading
 import queue
 from logger_config import setup_logger
 from polygon_store import PolygonStore
+from cpu_topology import CpuTopology
 
 polygon_store = PolygonStore("polygons.json")
 
 logger = setup_logger(__name__)
 
+def freeze(frame):
+    """Publish a frame read-only: every consumer shares the same array, a stage that draws copies first."""
+    frame.flags.writeable = False
+    return frame
+
+class FramePool:
+    """Ring of preallocated frames of one shape for one camera's capture thread.
+
+    Frames go out read-only (see freeze) and nobody hands them back explicitly: a buffer is
+    reused once nothing but the pool references it any more, i.e. once every queue, stage and
+    stream that held the frame (or a view of it) has let go. When all buffers are still held
+    the read falls back to a fresh allocation and counts it as an exhaustion.
+    Reads are serialized: a webcam is read by the capture stage and by MQTT image requests.
+    """
+
+    def __init__(self, width=640, height=360, size=12):
+        self.shape = (height, width, 3)
+        self.buffers = [np.empty(self.shape, np.uint8) for _ in range(size)]
+        self.scratch = None             # decode target when the stream is not at the output size
+        self._lock = threading.RLock()  # buffer hand-out, the scratch buffer and the capture itself
+        self._next = 0
+        self._free_refs = self._refs(0)
+        self.acquired = 0
+        self.exhausted = 0
+
+    def _refs(self, i):
+        return sys.getrefcount(self.buffers[i])
+
+    def acquire(self):
+        """A writable buffer nobody else holds, or None when the pool is exhausted."""
+        with self._lock:
+            size = len(self.buffers)
+            for k in range(size):
+                i = (self._next + k) % size
+                if self._refs(i) <= self._free_refs:
+                    self._next = (i + 1) % size
+                    buf = self.buffers[i]
+                    buf.flags.writeable = True
+                    self.acquired += 1
+                    return buf
+            self.exhausted += 1
+            return None
+
+    def read(self, cap, grabbed=False):
+        """cap.read() (cap.retrieve() after a grab()) into a pooled buffer, resized to the pool
+        shape on the way; (ok, frame)."""
+        with self._lock:
+            return self._read(cap.retrieve if grabbed else cap.read)
+
+    def _read(self, fetch):
+        buf = self.acquire()
+        h, w = self.shape[:2]
+        if self.scratch is None or self.scratch.shape[:2] == (h, w):
+            # decode straight into the published buffer while the stream is at the output size
+            ret, frame = fetch(image=buf) if buf is not None else fetch()
+            if not ret or frame is None or frame.size == 0:
+                return False, None
+            if frame.shape[:2] == (h, w):
+                return True, frame
+            self.scratch = frame        # other size: keep it as the decode target from now on
+        else:
+            ret, frame = fetch(image=self.scratch)
+            if not ret or frame is None or frame.size == 0:
+                return False, None
+            self.scratch = frame
+        return True, cv2.resize(frame, (w, h), dst=buf) if buf is not None else cv2.resize(frame, (w, h))
+
+    def stats(self):
+        in_use = sum(1 for i in range(len(self.buffers)) if self._refs(i) > self._free_refs)
+        return {"size": len(self.buffers), "in_use": in_use, "acquired": self.acquired, "exhausted": self.exhausted}
+
+def gstreamer_pipeline(rtsp_url, width=640, height=360, fps=15):
+    """RTSP -> decode -> drop to `fps` -> scale -> BGR at the working size, newest frame only.
+
+    Frames are dropped before they are scaled or converted, and appsink keeps a single buffer,
+    so the reader always gets the latest frame and never pays for the ones it would skip.
+    """
+    return (
+        f'rtspsrc location="{rtsp_url}" latency=0 protocols=tcp drop-on-latency=true '
+        "! decodebin "
+        "! videorate drop-only=true "
+        "! videoscale "
+        f"! video/x-raw,width={width},height={height},framerate={fps}/1 "
+        "! videoconvert "
+        "! video/x-raw,format=BGR "
+        "! appsink drop=true max-buffers=1 sync=false"
+    )
+
+def open_rtsp_capture(rtsp_url, use_gst=False, width=640, height=360, fps=15):
+    """Open an RTSP stream with GStreamer (scaled and rate-limited in the pipeline) or FFmpeg.
+
+    Returns (cap, backend name) or (None, None); GStreamer falls back to FFmpeg when OpenCV
+    was built without it or the pipeline does not start.
+    """
+    if use_gst:
+        cap = cv2.VideoCapture(gstreamer_pipeline(rtsp_url, width, height, fps), cv2.CAP_GSTREAMER)
+        if cap.isOpened():
+            return cap, "gstreamer"
+        cap.release()
+        logger.warning(f"GStreamer capture failed for {rtsp_url}, falling back to FFmpeg")
+
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = (
+        "rtsp_transport;tcp|max_delay;0|fflags;nobuffer"
+    )
+    # Or append URL options directly
+    if "?" not in rtsp_url:
+        rtsp_url += "?fflags=nobuffer&flags=low_delay&max_delay=0"
+    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        cap.release()
+        return None, None
+    # CRITICAL: Buffer & FPS
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    cap.set(cv2.CAP_PROP_FPS, fps)
+    return cap, "ffmpeg"
+
 class LowLatencyIPCamera:
     """Dedicated class for ultra-low latency IP camera handling"""
 
-    def __init__(self, rtsp_url, camera_no, name, target_fps=15, use_gst=False):
+    def __init__(self, rtsp_url, camera_no, name, target_fps=15, use_gst=False, pool_size=12):
         self.rtsp_url = rtsp_url
         self.camera_no = camera_no
         self.name = name
@@ -26,37 +144,28 @@ class LowLatencyIPCamera:
         self.cap = None
         self.latest_frame = None
         self.frame_lock = threading.Lock()
+        self.pool = FramePool(640, 360, pool_size)
         self.running = False
         self.capture_thread = None
-        self.frame_count = 0
-        self.last_fps_check = time.time()
+        self.grabbed_total = 0          # frames pulled off the stream (camera's native rate)
+        self.delivered_total = 0        # frames decoded and published (target rate)
+        self.real_fps = 0.0
+        self.delivered_fps = 0.0
 
         # CRITICAL: Frame timing
         self.frame_interval = 1.0 / target_fps
-        self.last_frame_time = 0
 
     def start(self):
         """Initialize and start the low-latency capture"""
         try:
-            os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = (
-                "rtsp_transport;tcp|max_delay;0|fflags;nobuffer"
-            )
+            # FFmpeg / GStreamer decode threads are spawned here and inherit the capture core set
+            with CpuTopology.shared().pinned("capture"):
+                self.cap, backend = open_rtsp_capture(self.rtsp_url, self.use_gst, 640, 360, self.target_fps)
 
-            # Or append URL options directly
-            if "?" not in self.rtsp_url:
-                self.rtsp_url += "?fflags=nobuffer&flags=low_delay&max_delay=0"
-
-            self.cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
-
-            if not self.cap.isOpened():
+            if self.cap is None:
                 print(f"❌ Failed to open IP camera {self.rtsp_url}")
                 return False
-
-            # CRITICAL: Buffer & FPS
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            self.cap.set(cv2.CAP_PROP_FPS, self.target_fps)
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 360)
+            self.use_gst = backend == "gstreamer"
 
             self.running = True
             self.capture_thread = threading.Thread(
@@ -72,53 +181,62 @@ class LowLatencyIPCamera:
             return False
 
     def _controlled_capture(self):
-        """Controlled capture at exact FPS intervals"""
+        """Drain the stream with grab() at the camera's rate; retrieve() only the frames the target FPS needs.
+
+        grab() blocks until the next frame arrives, so the loop never sleeps or spins and the
+        socket buffer never backs up; frames between two due times are grabbed and dropped
+        without being converted, resized or published.
+        """
+        CpuTopology.shared().pin("capture", f"cam-{self.camera_no}")
         consecutive_failures = 0
         max_failures = 30
+        next_due = time.monotonic()
+        window_start = next_due
+        window_grabbed = window_delivered = 0
 
         while self.running:
             try:
-                now = time.time()
-                if now - self.last_frame_time < self.frame_interval:
-                    time.sleep(0.001)
-                    continue
-
-                ret, frame = self.cap.read()
-                if not ret or frame is None or frame.size == 0:
+                if not self.cap.grab():
                     consecutive_failures += 1
                     if consecutive_failures > max_failures:
                         print(f"❌ Too many failures on camera {self.camera_no}")
                         break
                     time.sleep(0.01)
                     continue
-
-                if frame.shape[:2] != (360, 640):
-                    frame = cv2.resize(frame, (640, 360))
-                if not frame.flags["C_CONTIGUOUS"]:
-                    frame = np.ascontiguousarray(frame)
-
-                with self.frame_lock:
-                    self.latest_frame = frame.copy()
-                    self.frame_count += 1
-
-                self.last_frame_time = now
                 consecutive_failures = 0
+                self.grabbed_total += 1
+                window_grabbed += 1
+
+                now = time.monotonic()
+                if now >= next_due:
+                    # keep the schedule, but do not burst to catch up after a stall
+                    next_due = max(next_due + self.frame_interval, now)
+                    ret, frame = self.pool.read(self.cap, grabbed=True)
+                    if ret:
+                        # pooled, 640x360 and contiguous; handed over read-only, recycled once released
+                        with self.frame_lock:
+                            self.latest_frame = freeze(frame)
+                        self.delivered_total += 1
+                        window_delivered += 1
 
                 # FPS log every 30s
-                if now - self.last_fps_check >= 30:
-                    fps = self.frame_count / (now - self.last_fps_check)
-                    print(f"📸 Camera {self.camera_no} FPS: {fps:.2f} (target {self.target_fps})")
-                    self.frame_count = 0
-                    self.last_fps_check = now
+                if now - window_start >= 30:
+                    self.real_fps = window_grabbed / (now - window_start)
+                    self.delivered_fps = window_delivered / (now - window_start)
+                    print(f"📸 Camera {self.camera_no} FPS: real {self.real_fps:.2f}, delivered "
+                          f"{self.delivered_fps:.2f} (target {self.target_fps}) frame pool: {self.pool.stats()}")
+                    window_grabbed = window_delivered = 0
+                    window_start = now
 
             except Exception as e:
                 print(f"⚠️ Frame error cam {self.camera_no}: {e}")
                 time.sleep(0.01)
 
     def read(self):
+        """Latest frame, shared and read-only."""
         with self.frame_lock:
             if self.latest_frame is not None:
-                return True, self.latest_frame.copy()
+                return True, self.latest_frame
             return False, None
 
     def stop(self):
@@ -132,9 +250,10 @@ class LowLatencyIPCamera:
 class CameraConnection:
     MAX_CAMERAS = 2
 
-    def __init__(self, width: int = 640, height: int = 360) -> None:
+    def __init__(self, width: int = 640, height: int = 360, use_gst: bool = False) -> None:
         self.size_width = width
         self.size_height = height
+        self.use_gst = use_gst      # IP cameras through the GStreamer pipeline instead of FFmpeg
         self.cameras = {}
         self.backend2local = {}
         self.Amount_cameras = 0
@@ -333,7 +452,7 @@ class CameraConnection:
                 if "ip_camera_obj" in cam:
                     ret, frame = cam["ip_camera_obj"].read()
                 else:
-                    ret, frame = cam["cam"].read()
+                    ret, frame = cam["pool"].read(cam["cam"]) if "pool" in cam else cam["cam"].read()
 
                 if not ret or frame is None or frame.size == 0:
                     logger.debug(f"No frame yet from camera {camNO}")  # ⬅ downgrade to debug
@@ -344,7 +463,7 @@ class CameraConnection:
                 if not frame.flags['C_CONTIGUOUS']:
                     frame = np.ascontiguousarray(frame)
 
-                frames.append(frame)
+                frames.append(freeze(frame))
                 connected = True
 
             except Exception as e:
@@ -398,6 +517,7 @@ class CameraConnection:
             self.cameras[cameraNO] = {
                 "cameraNO": cameraNO,
                 "cam": cap,
+                "pool": FramePool(self.size_width, self.size_height),
                 "name": camera["name"],
                 "index": camera_index
             }
@@ -429,7 +549,7 @@ class CameraConnection:
             rtsp_url = camera["ip"]
             name = camera["name"]
 
-            ip_cam = LowLatencyIPCamera(rtsp_url, cameraNO, name, target_fps=15)
+            ip_cam = LowLatencyIPCamera(rtsp_url, cameraNO, name, target_fps=15, use_gst=self.use_gst)
 
             if not ip_cam.start():
                 logger.error(f"Failed to start 15 FPS IP camera {cameraNO}")
@@ -492,6 +612,12 @@ class CameraConnection:
     def get_cameras_on_device(self):
         return self.cameras_connected
 
+    def capture_stats(self) -> dict:
+        """cameraNO -> real (stream) vs delivered (decoded) FPS over the last 30 s window, IP cameras."""
+        return {no: {"real_fps": round(cam.real_fps, 2), "delivered_fps": round(cam.delivered_fps, 2),
+                     "target_fps": cam.target_fps, "pool_exhausted": cam.pool.exhausted}
+                for no, cam in list(self.ip_camera_threads.items())}
+
     def sync_remaining_cameras(self, remaining: list[dict], box_models=None, value_counter=None):
         """Keep only cameras in `remaining`. Remove others with full cleanup."""
         remain_local = set()
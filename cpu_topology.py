@@ -0,0 +1,156 @@
+#cpu_topology.py
+'''
+    Explicit CPU plan for the process: which cores capture, inference and streaming may use,
+    how many threads NCNN gets, and per-thread CPU usage for the periodic stats log.
+
+    Linux threads inherit the affinity of the thread that creates them, so pinning a thread
+    before it opens a VideoCapture, starts a GLib/asyncio loop or runs the first inference
+    also confines the FFmpeg, GStreamer, aiortc and OpenMP workers it spawns.
+
+    config.yaml (all keys optional):
+        Inference:
+          topology:
+            capture: [0]
+            streaming: [1]
+            inference: [2, 3]
+            other: [0, 1]
+            inference_threads: 2
+'''
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+ROLES = ("capture", "inference", "streaming", "other")
+
+
+def available_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def default_plan(cpus):
+    """Four or more cores: one each for capture and streaming, the rest for inference."""
+    if len(cpus) < 4:
+        return {role: list(cpus) for role in ROLES}
+    return {
+        "capture": [cpus[0]],
+        "streaming": [cpus[1]],
+        "inference": list(cpus[2:]),
+        "other": [cpus[0], cpus[1]],
+    }
+
+
+class CpuTopology:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, plan=None):
+        cpus = available_cpus()
+        plan = dict(plan or {})
+        self.plan = default_plan(cpus)
+        for role in ROLES:
+            wanted = [c for c in plan.get(role) or [] if c in cpus]
+            if wanted:
+                self.plan[role] = wanted
+            elif plan.get(role):
+                logger.warning(f"CPU set {plan[role]} for {role} is not available, using {self.plan[role]}")
+        self.inference_threads = int(plan.get("inference_threads") or len(self.plan["inference"]))
+        self.threads = {}           # native thread id -> (name, role)
+        self._last = {}             # native thread id -> (cpu seconds, wall time)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, plan=None):
+        """Process-wide topology; the first call (from main, with the config plan) wins."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(plan)
+            return cls._shared
+
+    def cpus(self, role):
+        return set(self.plan.get(role) or self.plan["other"])
+
+    def split(self, role, parts):
+        """Distribute a role's cores over `parts` processes (round-robin, at least one core each)."""
+        cpus = sorted(self.cpus(role))
+        return [set(cpus[i::parts]) or {cpus[i % len(cpus)]} for i in range(parts)]
+
+    def pin(self, role, name=None):
+        """Confine the calling thread (and everything it spawns later) to the role's cores."""
+        tid = threading.get_native_id()
+        try:
+            os.sched_setaffinity(0, self.cpus(role))
+        except (AttributeError, OSError) as e:
+            logger.debug(f"Could not pin {name or role} to {self.cpus(role)}: {e}")
+        with self._lock:
+            self.threads[tid] = (name or threading.current_thread().name, role)
+
+    def wrap(self, role, fn, name=None):
+        """Thread target that pins itself before running `fn`."""
+        def run(*args, **kwargs):
+            self.pin(role, name)
+            return fn(*args, **kwargs)
+        return run
+
+    @contextmanager
+    def pinned(self, role):
+        """Temporarily pin the calling thread, e.g. while a library creates its worker threads."""
+        try:
+            previous = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, self.cpus(role))
+        except (AttributeError, OSError):
+            previous = None
+        try:
+            yield
+        finally:
+            if previous is not None:
+                os.sched_setaffinity(0, previous)
+
+    def usage(self):
+        """CPU % of every thread of this process since the previous call, busiest first."""
+        ticks = os.sysconf("SC_CLK_TCK")
+        now = time.time()
+        report = []
+        try:
+            tids = [int(t) for t in os.listdir("/proc/self/task")]
+        except OSError:
+            return report
+        seen = set()
+        for tid in tids:
+            try:
+                with open(f"/proc/self/task/{tid}/stat", "r") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                with open(f"/proc/self/task/{tid}/comm", "r") as f:
+                    comm = f.read().strip()
+            except OSError:
+                continue
+            cpu = (int(fields[11]) + int(fields[12])) / ticks     # utime + stime
+            seen.add(tid)
+            last = self._last.get(tid)
+            self._last[tid] = (cpu, now)
+            if last is None or now <= last[1]:
+                continue
+            name, role = self.threads.get(tid, (comm, "-"))
+            report.append({"tid": tid, "name": name, "role": role, "cpu_core": int(fields[36]),
+                           "cpu_pct": round(100.0 * (cpu - last[0]) / (now - last[1]), 1)})
+        for tid in list(self._last):
+            if tid not in seen:
+                del self._last[tid]
+        with self._lock:
+            for tid in list(self.threads):
+                if tid not in seen:
+                    del self.threads[tid]
+        return sorted(report, key=lambda r: -r["cpu_pct"])
+
+    def stats(self, top=8):
+        return {
+            "plan": {role: sorted(self.cpus(role)) for role in ROLES},
+            "inference_threads": self.inference_threads,
+            "threads": self.usage()[:top],
+        }
@@ -17,6 +17,8 @@ class RealtimeFrameSource:
     latest_frame = None
     lock = threading.RLock()
     frame_timestamp = 0
+    rtsp_clients = 0        # RTSP sessions currently attached
+    render_until = 0.0      # annotated frames wanted until this time (snapshot requests)
     
     @classmethod
     def update_frame(cls, frame: np.ndarray) -> bool:
@@ -24,8 +26,10 @@ class RealtimeFrameSource:
             return False
         
         with cls.lock:
-            # Always take the latest frame, drop old ones
-            cls.latest_frame = frame.copy()
+            # Always take the latest frame, drop old ones; the pipeline never writes to a
+            # frame once it is handed on, so keep a read-only reference instead of a copy
+            frame.flags.writeable = False
+            cls.latest_frame = frame
             cls.frame_timestamp = time.time()
             return True
     
@@ -34,6 +38,16 @@ class RealtimeFrameSource:
         with cls.lock:
             return cls.latest_frame, cls.frame_timestamp
 
+    @classmethod
+    def request_render(cls, seconds: float = 2.0):
+        """Ask the pipeline for annotated frames for a while, e.g. for a one-off snapshot."""
+        with cls.lock:
+            cls.render_until = max(cls.render_until, time.time() + seconds)
+
+    @classmethod
+    def render_requested(cls) -> bool:
+        return time.time() < cls.render_until
+
 FrameSource = RealtimeFrameSource
 
 class RealtimeRTSPFactory(GstRtspServer.RTSPMediaFactory):
@@ -75,7 +89,7 @@ class RealtimeRTSPFactory(GstRtspServer.RTSPMediaFactory):
             appsrc.set_caps(caps)
             self.caps_set = True
         
-        # Create buffer with current timestamp (like setpts=0)
+        # Create buffer with current timestamp (like setpts=0); the one copy, into GStreamer memory
         frame_bytes = frame.tobytes()
         buf = Gst.Buffer.new_wrapped(frame_bytes)
         
@@ -130,6 +144,15 @@ def optimize_camera_url(base_url):
     else:
         return f"{base_url}?tcp_mode=1&buffer_size=1&max_delay=0"
 
+def _on_client_connected(server, client):
+    with FrameSource.lock:
+        FrameSource.rtsp_clients += 1
+    client.connect("closed", _on_client_closed)
+
+def _on_client_closed(client):
+    with FrameSource.lock:
+        FrameSource.rtsp_clients = max(0, FrameSource.rtsp_clients - 1)
+
 def start_realtime_rtsp_server(port=8554, fps=20, quality=30, mount="/stream"):
     """Start RTSP server optimized for real-time like ffplay"""
     server = GstRtspServer.RTSPServer()
@@ -140,6 +163,7 @@ def start_realtime_rtsp_server(port=8554, fps=20, quality=30, mount="/stream"):
     
     mount_points = server.get_mount_points()
     mount_points.add_factory(mount, factory)
+    server.connect("client-connected", _on_client_connected)
     
     server_id = server.attach(None)
     if server_id == 0:
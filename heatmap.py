@@ -0,0 +1,98 @@
+#heatmap.py
+'''
+    Occupancy heatmap per camera: where people stand, accumulated from box foot points.
+
+    The accumulator is float32 at a fraction of the frame resolution and decays
+    exponentially, so it shows the last `half_life` seconds or so rather than all time.
+    Each update is a bincount plus one multiply over a few thousand cells.
+'''
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+# cameraNO -> OccupancyHeatmap, for the HTTP route and the MQTT request handler
+HEATMAPS = {}
+
+
+class OccupancyHeatmap:
+    def __init__(self, width, height, cell=8, half_life=1800.0, max_dt=1.0):
+        self.width = width
+        self.height = height
+        self.cell = cell
+        self.grid = (max(1, height // cell), max(1, width // cell))
+        self.half_life = half_life
+        self.max_dt = max_dt                # cap on the weight of one frame (stalls, first frame)
+        self.acc = np.zeros(self.grid, np.float32)
+        self.background = None              # last frame seen, for the blended export
+        self.last_update = None
+        self.updates = 0
+        self._lock = threading.Lock()
+
+    def update(self, boxes, frame=None, now=None):
+        """Add one frame of boxes (N, >=4): every foot point gains person-seconds in its cell."""
+        now = time.monotonic() if now is None else now
+        dt = min(self.max_dt, now - self.last_update) if self.last_update is not None else 0.0
+        self.last_update = now
+        if frame is not None:
+            self.background = frame
+        if dt <= 0:
+            return
+        gh, gw = self.grid
+        with self._lock:
+            self.acc *= np.float32(0.5 ** (dt / self.half_life))
+            if boxes is not None and len(boxes):
+                b = np.asarray(boxes, np.float32)
+                gx = np.clip(((b[:, 0] + b[:, 2]) * 0.5 / self.cell).astype(np.intp), 0, gw - 1)
+                gy = np.clip((b[:, 3] / self.cell).astype(np.intp), 0, gh - 1)
+                self.acc += np.bincount(gy * gw + gx, minlength=gh * gw).reshape(gh, gw).astype(np.float32) * dt
+            self.updates += 1
+
+    def render(self, blend=0.5):
+        """BGR colour-mapped heatmap at frame size, over the last frame when `blend` > 0."""
+        with self._lock:
+            acc = self.acc.copy()
+        acc = cv2.GaussianBlur(acc, (5, 5), 0)
+        peak = float(acc.max())
+        norm = (acc * (255.0 / peak)).astype(np.uint8) if peak > 0 else np.zeros(acc.shape, np.uint8)
+        colored = cv2.applyColorMap(cv2.resize(norm, (self.width, self.height), interpolation=cv2.INTER_LINEAR),
+                                    cv2.COLORMAP_JET)
+        bg = self.background
+        if blend > 0 and bg is not None and bg.shape[:2] == colored.shape[:2]:
+            colored = cv2.addWeighted(colored, blend, bg, 1.0 - blend, 0)
+        return colored
+
+    def encode(self, quality=85, blend=0.5):
+        """JPEG bytes of render()."""
+        ok, buf = cv2.imencode(".jpg", self.render(blend), [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        return bytes(buf) if ok else None
+
+    def save(self, path):
+        """Snapshot to `<path>.npy` (raw accumulator) and `<path>.jpg` (rendered)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            acc = self.acc.copy()
+        np.save(f"{path}.tmp.npy", acc)
+        os.replace(f"{path}.tmp.npy", f"{path}.npy")
+        jpg = self.encode()
+        if jpg is not None:
+            with open(f"{path}.jpg", "wb") as f:
+                f.write(jpg)
+
+    def load(self, path):
+        """Resume from a snapshot written by save(); ignored when missing or of another shape."""
+        try:
+            acc = np.load(f"{path}.npy")
+        except (OSError, ValueError):
+            return False
+        if acc.shape != self.grid:
+            logger.warning(f"Heatmap snapshot {path}.npy has shape {acc.shape}, expected {self.grid}")
+            return False
+        with self._lock:
+            self.acc[:] = acc
+        return True
@@ -0,0 +1,209 @@
+#inference_pool.py
+'''
+    Multi-process inference: worker processes fed through a shared-memory frame ring.
+
+    Frames are written once into a `multiprocessing.shared_memory` ring (slot header:
+    sequence number, height, width). Workers read them in place, run their own
+    InferenceEngine and send back only the compact (N, 6) detection arrays.
+    ProcessInferencePool.predict() has the same contract as InferenceEngine.predict().
+'''
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+HEADER_FIELDS = 3   # seq, height, width
+
+
+class SharedFrameRing:
+    """Fixed ring of frame slots in shared memory; slot layout (slots, max_h, max_w, 3) uint8."""
+
+    def __init__(self, slots, max_h, max_w, name=None):
+        self.slots = slots
+        self.shape = (slots, max_h, max_w, 3)
+        header_bytes = slots * HEADER_FIELDS * 8
+        frame_bytes = slots * max_h * max_w * 3
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + frame_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.header = np.ndarray((slots, HEADER_FIELDS), np.int64, self.shm.buf, 0)
+        self.frames = np.ndarray(self.shape, np.uint8, self.shm.buf, header_bytes)
+        if self.owner:
+            self.header[:] = 0
+        self._seq = 0
+        self._next = 0
+
+    def write(self, frame):
+        """Copy `frame` into the next slot and return (slot, seq)."""
+        h, w = frame.shape[:2]
+        if h > self.shape[1] or w > self.shape[2]:
+            raise ValueError(f"Frame {w}x{h} does not fit ring slot {self.shape[2]}x{self.shape[1]}")
+        slot = self._next
+        self._next = (self._next + 1) % self.slots
+        self._seq += 1
+        self.header[slot, 0] = 0            # invalidate while writing
+        self.frames[slot, :h, :w] = frame
+        self.header[slot, 1:] = (h, w)
+        self.header[slot, 0] = self._seq
+        return slot, self._seq
+
+    def read(self, slot, seq):
+        """View of the frame in `slot`, or None if it was overwritten since `seq` was issued."""
+        if self.header[slot, 0] != seq:
+            return None
+        h, w = self.header[slot, 1], self.header[slot, 2]
+        return self.frames[slot, :h, :w]
+
+    def close(self):
+        del self.header, self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(ring_name, ring_shape, tasks, results, engine_kwargs, cpus, warmup):
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError):
+            pass
+    from boxprocess import InferenceEngine, EMPTY_BOXES
+
+    slots, max_h, max_w, _ = ring_shape
+    ring = SharedFrameRing(slots, max_h, max_w, name=ring_name)
+    engine = InferenceEngine(**engine_kwargs)
+    engine.warmup(warmup)
+    results.put(("ready", os.getpid(), None))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, slot, seq, size = task
+        frame = ring.read(slot, seq)
+        if frame is None:
+            results.put((task_id, seq, EMPTY_BOXES))    # overwritten before we got to it
+            continue
+        dets = engine.predict([frame], [size])[0]
+        if ring.header[slot, 0] != seq:
+            dets = EMPTY_BOXES                          # torn read
+        results.put((task_id, seq, dets))
+    ring.close()
+
+
+class ProcessInferencePool:
+    """Drop-in replacement for InferenceEngine that spreads a batch over worker processes.
+
+    Use one worker per core (or per camera); `cpus_per_worker` pins each worker to its
+    own core set. Workers are forked, so create the pool before starting other threads.
+    """
+
+    def __init__(self, workers=2, max_h=360, max_w=640, slots=None, cpus_per_worker=None,
+                 timeout=10.0, warmup=3, **engine_kwargs):
+        from boxprocess import DETECT_CONF
+
+        self.workers = workers
+        self.timeout = timeout
+        self.conf = engine_kwargs.get("conf", DETECT_CONF)     # what the workers' detectors keep
+        self.ring = SharedFrameRing(slots or workers * 2, max_h, max_w)
+        ctx = mp.get_context("fork")
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.procs = []
+        for i in range(workers):
+            cpus = cpus_per_worker[i % len(cpus_per_worker)] if cpus_per_worker else None
+            p = ctx.Process(target=_worker_main, name=f"inference-{i}", daemon=True,
+                            args=(self.ring.name, self.ring.shape, self.tasks, self.results,
+                                  engine_kwargs, cpus, warmup))
+            p.start()
+            self.procs.append(p)
+        self._ready = 0
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+        self.last_latency = 0.0
+        self.frame_latency = 0.0
+        self.batches = 0
+        self.frames = 0
+        self.stale = 0
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has loaded its model."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._ready < self.workers:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            tag, pid, _ = self.results.get(timeout=remaining)
+            if tag == "ready":
+                self._ready += 1
+                logger.info(f"Inference worker {pid} ready")
+        return True
+
+    def predict(self, frames, imgsz=None):
+        """Same contract as InferenceEngine.predict(): one (N, 6) array per frame."""
+        if not frames:
+            return []
+        sizes = imgsz if imgsz is not None else [None] * len(frames)
+        with self._lock:
+            start = time.perf_counter()
+            # More frames than slots would overwrite in-flight work; go in ring-sized chunks
+            out = []
+            step = self.ring.slots
+            for i in range(0, len(frames), step):
+                out.extend(self._run_chunk(frames[i:i + step], sizes[i:i + step]))
+            self.last_latency = time.perf_counter() - start
+            per_frame = self.last_latency / len(frames)
+            self.frame_latency = (per_frame if self.frame_latency == 0
+                                  else 0.8 * self.frame_latency + 0.2 * per_frame)
+            self.batches += 1
+            self.frames += len(frames)
+        return out
+
+    def _run_chunk(self, frames, sizes):
+        pending = {}
+        for frame, size in zip(frames, sizes):
+            slot, seq = self.ring.write(frame)
+            task_id = next(self._task_ids)
+            self.tasks.put((task_id, slot, seq, size))
+            pending[task_id] = None
+        order = list(pending)
+        got = 0
+        while got < len(order):
+            try:
+                task_id, _, dets = self.results.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"Inference workers did not answer within {self.timeout}s")
+            if task_id == "ready":
+                self._ready += 1
+                continue
+            if task_id not in pending:
+                self.stale += 1      # late answer from a batch that already timed out
+                continue
+            pending[task_id] = dets
+            got += 1
+        return [pending[t] for t in order]
+
+    def stats(self):
+        return {
+            "workers": sum(p.is_alive() for p in self.procs),
+            "frame_latency_ms": round(self.frame_latency * 1000, 2),
+            "frames": self.frames,
+            "stale": self.stale,
+        }
+
+    def close(self):
+        for _ in self.procs:
+            self.tasks.put(None)
+        for p in self.procs:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        self.ring.close()
@@ -23,12 +23,13 @@ from mq_connector import Mqtt_Connect
 from button_light import Button_Action
 from camera import CameraConnection
 from devicecare import DeviceCare
-from boxprocess import ModelboxProcess
+from boxprocess import (ModelboxProcess, InferenceEngine, InferenceScheduler, MotionGate, BoxPropagator,
+                        InputSizeSelector, available_input_sizes, model_path_for_precision, MODEL_PATH)
 from datetime import datetime
 from record_v import MultiCameraRecorder
 from sdnotify import SystemdNotifier
 from gstream_rtsp_server import FrameSource
-from webrtc_server import start_webrtc_server, current_stream, state_lock
+from webrtc_server import start_webrtc_server, current_stream, state_lock, viewer_count
 import subprocess
 from concurrent.futures import ThreadPoolExecutor
 import copy
@@ -36,6 +37,13 @@ import json
 from pathlib import Path
 from env_setup import initialize_gpio, setup_environment
 from polygon_store import PolygonStore
+from tracker import ByteTracker
+from object_counter import LineCrossingCounter
+from zone_analytics import DwellTracker
+from heatmap import OccupancyHeatmap, HEATMAPS
+from pipeline import DropOldestQueue, LatestPerKeyQueue, Stage
+from inference_pool import ProcessInferencePool
+from cpu_topology import CpuTopology
 
 if not initialize_gpio():
     print("❌ CRITICAL: GPIO initialization failed!")
@@ -52,7 +60,7 @@ POLYGON_FILE = Path("polygons.json")
 notifier = SystemdNotifier()
 
 # Global Queues and Events
-data_queue = queue.Queue(maxsize=10)
+data_queue = DropOldestQueue("data", maxsize=2)     # only the latest results are published; also pins pooled frames
 state_light = queue.Queue(maxsize=1)
 mqtt_queue = queue.Queue(maxsize=2)
 event = Event()
@@ -60,6 +68,7 @@ event_light = Event()
 
 # Constants
 WIDTH, HEIGHT = 640, 360
+PROCESS_START = time.time()
 
 # Connect with server
 def result_sending():
@@ -223,6 +232,10 @@ def update_rtsp_stream(frames_by_no, camera_id):
     else:
         FrameSource.update_frame(draw_no_camera_frame('No camera'))
 
+def stream_wanted():
+    """Someone looks at the selected camera: a WebRTC peer, an RTSP client or a pending snapshot."""
+    return viewer_count() > 0 or FrameSource.rtsp_clients > 0 or FrameSource.render_requested()
+
 def load_polygons_from_file(camera_id=0):
     """Load polygons for a given camera id from polygons.json"""
     if not POLYGON_FILE.exists():
@@ -250,7 +263,41 @@ def detect_camera_fps(cameras, duration=5):
     fps = count / elapsed if elapsed > 0 else 0
     return min(fps, 15)
 
+def load_inference_config():
+    """Optional `Inference:` section of config.yaml ({} when absent)."""
+    try:
+        with open("config.yaml", "r") as file:
+            return (yaml.safe_load(file) or {}).get('Inference') or {}
+    except FileNotFoundError:
+        return {}
+
 def main():
+    inference_cfg = load_inference_config()
+    # Core sets for capture / inference / streaming; threads inherit the set of whoever spawns them
+    topology = CpuTopology.shared(inference_cfg.get('topology'))
+    logger.info(f"CPU topology: {topology.stats(top=0)}")
+
+    # Inference worker processes are forked, so they must exist before any thread starts
+    inference_pool = None
+    warmup_runs = int(inference_cfg.get('warmup_runs', 3))
+    precision = inference_cfg.get('precision', 'fp32')              # fp32 | int8 (model/<name>_int8)
+    workers = int(inference_cfg.get('process_workers', 0) or 0)
+    if workers > 0:
+        inference_pool = ProcessInferencePool(
+            workers=workers, max_h=HEIGHT, max_w=WIDTH,
+            cpus_per_worker=topology.split("inference", workers),
+            backend=inference_cfg.get('backend', 'ultralytics'),
+            num_threads=inference_cfg.get('worker_threads') or max(1, topology.inference_threads // workers),
+            precision=precision,
+            warmup=warmup_runs,
+        )
+    else:
+        # Load and warm the detector while the network and MQTT come up
+        with topology.pinned("inference"):
+            InferenceEngine.preload(warmup=warmup_runs, backend=inference_cfg.get('backend', 'ultralytics'),
+                                    precision=precision, num_threads=topology.inference_threads)
+
+    Thread(target=monitor_performance, daemon=True).start()
     Thread(target=light_notification, daemon=True).start()
     Thread(target=reset, daemon=True).start()
     Thread(target=result_sending, daemon=True).start()
@@ -290,7 +337,7 @@ def main():
     mqtt = None
             
     try:
-        cameras = CameraConnection()
+        cameras = CameraConnection(use_gst=inference_cfg.get('capture_backend', 'ffmpeg') == 'gstreamer')
         mqtt = Mqtt_Connect(device['type'], device['version'],device['key_from_server'],cameras)
         last_cam = -1
 
@@ -319,11 +366,60 @@ def main():
         logger.info(f"Loaded sensor values: {value_counter}")
 
         #---------------------- Init -------------------------------------
+        # One detector for every camera; ModelboxProcess instances only hold counting state
+        if inference_pool is not None:
+            inference_pool.wait_ready(timeout=120)
+            engine = inference_pool
+        else:
+            engine = InferenceEngine.shared(backend=inference_cfg.get('backend', 'ultralytics'),
+                                            precision=precision, num_threads=topology.inference_threads)
+            logger.info(f"Detector ready ({engine.precision}): load {engine.load_time:.2f}s, warm-up {engine.warmup_time:.2f}s, "
+                        f"{time.time() - PROCESS_START:.1f}s after start")
+        target_fps = inference_cfg.get('target_fps', 15)
+        inference_budget = inference_cfg.get('inference_budget', 0.6)  # share of each frame period, all cameras
+        use_motion_gate = inference_cfg.get('motion_gate', True)
+        motion_keepalive = inference_cfg.get('motion_keepalive', 5.0)    # seconds between forced runs
+        zone_crop = inference_cfg.get('zone_crop', False)
+        propagation = inference_cfg.get('propagation', 'none')          # none | velocity | flow
+        use_tracker = inference_cfg.get('tracker', True)                # supersedes propagation
+        # per-camera input size among the sizes that have an export on disk
+        input_sizes = available_input_sizes(model_path_for_precision(MODEL_PATH, precision),
+                                            candidates=inference_cfg.get('input_sizes', (256, 320, 416, 512)))
+        use_heatmap = inference_cfg.get('heatmap', True)
+        heatmap_dir = inference_cfg.get('heatmap_dir', 'heatmaps')
+        heatmap_snapshot = inference_cfg.get('heatmap_snapshot_interval', 300)   # seconds
+        last_heatmap_snapshot = time.time()
+        recording = inference_cfg.get('recording', True)    # annotated video of every camera to disk
+
+        def heatmap_for(cam_no):
+            # one accumulator per camera for the life of the process, resumed from the last snapshot
+            if not use_heatmap:
+                return None
+            if cam_no not in HEATMAPS:
+                heatmap = OccupancyHeatmap(WIDTH, HEIGHT)
+                if heatmap.load(os.path.join(heatmap_dir, f"cam_{cam_no}")):
+                    logger.info(f"🔥 Heatmap for cam {cam_no} resumed from snapshot")
+                HEATMAPS[cam_no] = heatmap
+            return HEATMAPS[cam_no]
+
+        def new_box_model(val, cam_no):
+            scheduler = InferenceScheduler(target_fps=target_fps,
+                                           budget=inference_budget / max(1, len(cameras.cameras)))
+            gate = MotionGate(WIDTH, HEIGHT, keepalive=motion_keepalive) if use_motion_gate else None
+            return ModelboxProcess(WIDTH, HEIGHT, value=val, engine=engine, scheduler=scheduler,
+                                   motion_gate=gate, zone_crop=zone_crop,
+                                   propagator=BoxPropagator(propagation),
+                                   tracker=ByteTracker(high_thresh=engine.conf, new_thresh=engine.conf) if use_tracker else None,
+                                   line_counter=LineCrossingCounter() if use_tracker else None,
+                                   dwell=DwellTracker() if use_tracker else None,
+                                   heatmap=heatmap_for(cam_no),
+                                   size_selector=InputSizeSelector(input_sizes) if len(input_sizes) > 1 else None)
+
         box_models = {}
         cam_ids = sorted(cameras.cameras.keys())
         for idx, cam_no in enumerate(cam_ids):
             try:
-                model = ModelboxProcess(WIDTH, HEIGHT, value=value_counter[idx])
+                model = new_box_model(value_counter[idx], cam_no)
                 box_models[cam_no] = model
                 print(f"📦 Model for cam {cam_no} initialized")
             except IndexError:
@@ -334,10 +430,10 @@ def main():
         real_fps = int(detect_camera_fps(cameras))
         print(f"📷 Detected camera FPS: {real_fps}")
 
-        Thread(target=lambda: gstream_rtsp_server.start_realtime_rtsp_server(
+        Thread(target=topology.wrap("streaming", lambda: gstream_rtsp_server.start_realtime_rtsp_server(
             port=8554, fps=real_fps, mount="/stream"
-        ), daemon=True).start()
-        Thread(target=start_webrtc_server, daemon=True).start()
+        ), name="rtsp"), daemon=True).start()
+        Thread(target=topology.wrap("streaming", start_webrtc_server, name="webrtc"), daemon=True).start()
 
         spacer = np.full((500, 10, 3), 220, dtype=np.uint8)
         state_light.put(3)
@@ -352,12 +448,157 @@ def main():
         last_stream_time = 0
 
         frame_buffer = FrameBuffer()
+        last_stats_log = time.time()
+
+        # ---------------------- Pipeline ----------------------------------
+        # capture -> inference (async) and capture -> render -> publish / stream / record
+        live = {"box_models": box_models}      # swapped by the control loop on re-setting
+        capture_gate = Event()                  # cleared while cameras/settings are rebuilt
+        first_count = Event()                   # set once the first counts are published
+        infer_q = LatestPerKeyQueue("inference")    # one pending request per camera, never lost to another camera
+        render_q = DropOldestQueue("render", maxsize=2)
+        publish_q = DropOldestQueue("publish", maxsize=2)
+        stream_q = DropOldestQueue("stream", maxsize=1)
+        record_q = DropOldestQueue("record", maxsize=4)
+        render_pool = ThreadPoolExecutor(max_workers=max(2, CameraConnection.MAX_CAMERAS))
+        render_stats = {"rendered": 0, "skipped": 0}
+
+        def capture_stage():
+            frames = [optimize_frame(f) for f in cameras.read_frame()]
+            cam_ids = sorted(cameras.cameras.keys())  # real cameraNOs
+            models = live["box_models"]
+
+            frames_by_no = {}
+            all_frames = []
+            batch = {}      # cameraNO -> request, every camera due for detection this tick
+            for idx, cam_no in enumerate(cam_ids):
+                frame = frames[idx] if idx < len(frames) else None
+                all_frames.append(frame)
+                if frame is None:
+                    continue
+                frames_by_no[cam_no] = frame
+                model = models.get(cam_no)
+                if model is not None and model.should_infer(frame):
+                    view, offset = model.detector_input(frame)
+                    batch[cam_no] = (model, view, offset, model.input_size(), time.time())
+
+            notifier.notify("WATCHDOG=1")
+            if batch:
+                infer_q.put(batch)
+            render_q.put({"frames": frames_by_no, "all_frames": all_frames})
+
+        def inference_stage(pending):
+            batch = list(pending.values())
+            detections = engine.predict([view for _, view, _, _, _ in batch],
+                                        [size for _, _, _, size, _ in batch])
+            for (model, _, offset, _, started), dets in zip(batch, detections):
+                model.deliver(dets, offset, started)
+
+        def render_stage(tick):
+            models = live["box_models"]
+            frames_by_no = dict(tick["frames"])
+            # counting always runs; drawing only for frames that end up in front of someone
+            watched = get_selected_camera_id() if stream_wanted() else None
+            futures = []
+            for cam_no, frame in tick["frames"].items():
+                if cam_no not in models:
+                    continue
+                render = recording or cam_no == watched
+                render_stats["rendered" if render else "skipped"] += 1
+                futures.append(render_pool.submit(process_frame, frame, models[cam_no], cam_no, None, render))
+            result_map = {}
+            line_map = {}
+            dwell_map = {}
+            for fut in futures:
+                cam_no, frame_out, counts, lines, dwell = fut.result()
+                if counts:
+                    result_map[cam_no] = counts
+                if lines:
+                    line_map[cam_no] = lines
+                if dwell:
+                    dwell_map[cam_no] = dwell
+                if isinstance(frame_out, np.ndarray):
+                    frames_by_no[cam_no] = frame_out
+            tick["frames_by_no"] = frames_by_no
+            tick["result_map"] = result_map
+            tick["line_map"] = line_map
+            tick["dwell_map"] = dwell_map
+            return tick
+
+        def publish_stage(tick):
+            # ========= Structure results as JSON (unchanged) =========
+            result_map = tick["result_map"]
+            if result_map and not first_count.is_set():
+                first_count.set()
+                logger.info(f"⏱️ Time to first count: {time.time() - PROCESS_START:.1f}s")
+            line_map = tick.get("line_map", {})
+            dwell_map = tick.get("dwell_map", {})
+            structured_results = []
+            for cam_no in sorted(result_map.keys()):
+                entry = {
+                    "cameraNO": cam_no,
+                    "value": result_map[cam_no]
+                }
+                if cam_no in line_map:
+                    entry["lines"] = line_map[cam_no]      # [{"name", "in", "out"}, ...]
+                if cam_no in dwell_map:
+                    entry["dwell"] = dwell_map[cam_no]     # per zone, same order as "value"
+                structured_results.append(entry)
+            total = sum(sum(v) for v in result_map.values())
+            structured_payload = {
+                "cameras": structured_results,
+                "total": total
+            }
+            data_queue.put({'results': structured_payload, 'images': tick["all_frames"]})
+
+        def stream_stage(tick):
+            frames_by_no = tick["frames_by_no"]
+
+            # --- Reconcile selected_cam_id with actual frames ---
+            valid_ids = list(frames_by_no.keys())
+            with state_lock:
+                if current_stream.get("selected_cam_id") not in valid_ids:
+                    current_stream["selected_cam_id"] = valid_ids[0] if valid_ids else None
+
+            sel_id = get_selected_camera_id()
+            if not stream_wanted():
+                return
+
+            # --- Update RTSP/WebRTC frame source ---
+            if sel_id in frames_by_no:
+                FrameSource.latest_raw_frame = frames_by_no[sel_id]
+            else:
+                FrameSource.latest_raw_frame = draw_no_camera_frame("No camera")
+            update_rtsp_stream(frames_by_no, sel_id)
+
+        def record_stage(tick):
+            if recording:
+                recorder.record_video_dict(tick["frames_by_no"])
+
+        stages = [
+            Stage("capture", capture_stage, interval=1.0 / target_fps, gate=capture_gate,
+                  on_start=lambda: topology.pin("capture", "stage-capture")),
+            Stage("inference", inference_stage, inbox=infer_q,
+                  on_start=lambda: topology.pin("inference", "stage-inference")),
+            Stage("render", render_stage, inbox=render_q, outboxes=(publish_q, stream_q, record_q),
+                  on_start=lambda: topology.pin("other", "stage-render")),
+            Stage("publish", publish_stage, inbox=publish_q,
+                  on_start=lambda: topology.pin("other", "stage-publish")),
+            Stage("stream", stream_stage, inbox=stream_q,
+                  on_start=lambda: topology.pin("streaming", "stage-stream")),
+            Stage("record", record_stage, inbox=record_q,
+                  on_start=lambda: topology.pin("other", "stage-record")),
+        ]
+        for stage in stages:
+            stage.start()
 
         while True:
-            # ------------------------------ Process Loop ------------------------------ #
+            # ------------------------------ Control Loop ------------------------------ #
 
             if not mqtt.is_connected():
+                capture_gate.clear()
                 call_setting = True
+                time.sleep(0.1)
                 continue
                                     
             if call_setting:
@@ -377,20 +618,23 @@ def main():
                 num_models = min(len(value_counter), len(cam_ids))
                 box_models = {}
                 for idx, cam_no in enumerate(cam_ids[:num_models]):
-                    model = ModelboxProcess(WIDTH, HEIGHT, value=value_counter[idx])
+                    model = new_box_model(value_counter[idx], cam_no)
                     box_models[cam_no] = model
                     print(f"📦 Model for cam {cam_no} re-initialized")
 
+                live["box_models"] = box_models
                 mqtt.set_box_model(model=box_models)
                 logger.info(f"API status: {api_status}")
                 call_setting = False
 
+            cam_ids = sorted(cameras.cameras.keys())  # real cameraNOs
+
             # --- Sync box_models with current cam_ids ---
             for idx, cam_no in enumerate(cam_ids):
                 if cam_no not in box_models:
                     try:
                         val = value_counter[idx] if idx < len(value_counter) else [0, 0]
-                        box_models[cam_no] = ModelboxProcess(WIDTH, HEIGHT, value=val)
+                        box_models[cam_no] = new_box_model(val, cam_no)
                         logger.info(f"📦 Model created for new cam {cam_no}")
                     except Exception as e:
                         logger.error(f"❌ Failed to init model for cam {cam_no}: {e}")
@@ -399,10 +643,15 @@ def main():
             for stale in list(box_models.keys()):
                 if stale not in cam_ids:
                     box_models.pop(stale, None)
+                    HEATMAPS.pop(stale, None)
                     logger.info(f"🗑️ Removed model for cam {stale}")
 
+            # Split the inference budget across the cameras that are actually running
+            for model in box_models.values():
+                model.scheduler.budget = inference_budget / max(1, len(box_models))
+
             # --- Update polygons for each model ---
-            for cam_no, model in box_models.items():
+            for cam_no, model in list(box_models.items()):
                 polygons = polygon_store.get_polygons(cam_no) or []
                 model.set_polygons([
                     {"coord": p.get("coord", []),
@@ -410,82 +659,37 @@ def main():
                     "name": p.get("name", f"Area-{i+1}")}
                     for i, p in enumerate(polygons)
                 ])
+                model.set_lines(polygon_store.get_lines(cam_no))
 
-            # --- Grab frames ---
-            frames = [optimize_frame(f) for f in cameras.read_frame()]
-            cam_ids = sorted(cameras.cameras.keys())  # real cameraNOs
-
-            # Build frames_by_no dict
-            frames_by_no = {}
-            all_frames = []
-            for idx, cam_no in enumerate(cam_ids):
-                frame = frames[idx] if idx < len(frames) else None
-                if frame is not None:
-                    frames_by_no[cam_no] = frame
-                all_frames.append(frame)
-
-            notifier.notify("WATCHDOG=1")
-
-            # ========= Inference =========
-            result_map = {}
-            with ThreadPoolExecutor(max_workers=max(2, len(cam_ids))) as executor:
-                futures = []
-                for idx, cam_no in enumerate(cam_ids):
-                    frame = frames[idx] if idx < len(frames) else None
-                    model = box_models.get(cam_no)
-                    if model is None:
-                        continue
-                    futures.append(executor.submit(process_frame, frame, model, cam_no))
-
-                for fut in futures:
-                    cam_no, frame_tuple, counts, *_ = fut.result()
-                    if counts:
-                        result_map[cam_no] = counts
-                    if frame_tuple is not None:
-                        frames_by_no[cam_no] = frame_tuple
+            capture_gate.set()
 
-            # ========= Structure results as JSON (unchanged) =========
-            active_cams = sorted(result_map.keys())
-            structured_results = []
-            for cam_no in active_cams:
-                structured_results.append({
-                    "cameraNO": cam_no,
-                    "value": result_map[cam_no]
-                })
-            total = sum(sum(v) for v in result_map.values())
-            structured_payload = {
-                "cameras": structured_results,
-                "total": total
-            }
-
-            # --- Reconcile selected_cam_id with actual frames ---
-            valid_ids = list(frames_by_no.keys())
-            with state_lock:
-                if current_stream.get("selected_cam_id") not in valid_ids:
-                    current_stream["selected_cam_id"] = valid_ids[0] if valid_ids else None
-
-            sel_id = get_selected_camera_id()
-
-            # --- Update RTSP/WebRTC frame source ---
-            if sel_id in frames_by_no:
-                FrameSource.latest_raw_frame = frames_by_no[sel_id]
-                # print(f"🎥 Streaming camera ID {sel_id}")
-            else:
-                FrameSource.latest_raw_frame = draw_no_camera_frame("No camera")
-
-            # print("🔎 selected_cam =", current_stream["selected_cam_id"], 
-            #     "cam_ids =", cam_ids, 
-            #     "frames_by_no keys =", list(frames_by_no.keys()))
-
-            # ========= Send out =========
-            data_queue.put({'results': structured_payload, 'images': all_frames})
-
-            # --- Update RTSP stream ---
-            selected_camera_id = get_selected_camera_id()
-            update_rtsp_stream(frames_by_no, selected_camera_id)
-
-            #-------- Record Video ----------
-            recorder.record_video_dict(frames_by_no)
+            # -------- Heatmap snapshots ----------
+            if use_heatmap and time.time() - last_heatmap_snapshot >= heatmap_snapshot:
+                for cam_no, heatmap in list(HEATMAPS.items()):
+                    try:
+                        heatmap.save(os.path.join(heatmap_dir, f"cam_{cam_no}"))
+                    except OSError as e:
+                        logger.warning(f"Heatmap snapshot for cam {cam_no} failed: {e}")
+                last_heatmap_snapshot = time.time()
+
+            # -------- Pipeline / scheduler stats every 30s ----------
+            if time.time() - last_stats_log >= 30:
+                for stage in stages:
+                    logger.info(f"Stage {stage.stage_name}: {stage.stats()}")
+                if inference_pool is not None:
+                    logger.info(f"Inference pool: {inference_pool.stats()}")
+                logger.info(f"CPU per thread: {topology.usage()[:8]}")
+                logger.info(f"Capture: {cameras.capture_stats()}")
+                logger.info(f"Render: {render_stats['rendered']} frames annotated, {render_stats['skipped']} count-only "
+                            f"(viewers: webrtc={viewer_count()} rtsp={FrameSource.rtsp_clients}, recording={recording})")
+                for cam_no, model in list(box_models.items()):
+                    logger.info(f"Cam {cam_no} inference: {model.scheduler.stats()} "
+                                f"propagation: {model.propagator.stats()} "
+                                f"input: {model.size_selector.stats() if model.size_selector else model.input_size()} "
+                                f"latency={engine.frame_latency * 1000:.1f}ms")
+                last_stats_log = time.time()
+
+            time.sleep(0.2)
 
             # ------------------------------ END ------------------------------ #
 
@@ -494,21 +698,21 @@ def main():
         mqtt.disconnect()
         logger.critical(f"The error is: {e}",exc_info=True)
 
-def process_frame(frame, model, camera_index):
-    """Process a single frame in parallel"""
+def process_frame(frame, model, camera_index, detections=None, render=True):
+    """Process a single frame in parallel; `render=False` counts without drawing"""
     try:
         if frame is None:
             logger.warning(f"Received None frame for camera {camera_index}")
             return (camera_index, (None, None), [], None, None)
             
         # logger.debug(f"Processing frame for camera {camera_index}: shape={frame.shape}")
-        frame, value = model(frame)
+        frame, value = model.process(frame, detections, show_regions=render, show_boxes=render)
         
         # Validate outputs
         if frame is None:
             logger.warning(f"Model returned None frames for camera {camera_index}")
 
-        return (camera_index, frame, value, None, None)
+        return (camera_index, frame, value, model.line_totals(), model.dwell_stats())
 
     except Exception as e:
         logger.error(f"Error processing camera {camera_index}: {e}", exc_info=True)
@@ -536,6 +740,4 @@ def monitor_performance():
         time.sleep(5)
 
 if __name__ == "__main__":
-    # Add to main():
-    Thread(target=monitor_performance, daemon=True).start()
     main()
@@ -21,12 +21,46 @@ from button_light import outload_Relay
 from device_register import register_device
 from logger_config import setup_logger
 import webrtc_server
+from heatmap import HEATMAPS
 import re
 import subprocess
 from collections import defaultdict
 
 #set logger
 logger = setup_logger(__name__)
+
+# sensorSelect codes: 1 = total of all cameras, 2 = area 1, 3 = area 2, ... k + 1 = area k,
+# 100 + 2j = line j+1 "in" total, 101 + 2j = line j+1 "out" total,
+# 300 + 2k = area k+1 mean dwell seconds, 301 + 2k = area k+1 longest current dwell seconds
+SELECT_TOTAL = 1
+SELECT_FIRST_AREA = 2
+SELECT_FIRST_LINE = 100
+SELECT_FIRST_DWELL = 300    # above the codes of the 64 lines a camera may have
+
+
+def zone_value(cam_entry, detectObj):
+    """Count of the zone a sensorSelect code refers to (0 when the camera has no such zone)."""
+    zone = detectObj - SELECT_FIRST_AREA
+    values = cam_entry["value"] if cam_entry else []
+    return values[zone] if 0 <= zone < len(values) else 0
+
+
+def line_value(cam_entry, detectObj):
+    """In or out total of the counting line a sensorSelect code >= SELECT_FIRST_LINE refers to."""
+    line, direction = divmod(detectObj - SELECT_FIRST_LINE, 2)
+    lines = cam_entry.get("lines", []) if cam_entry else []
+    if line >= len(lines):
+        return 0
+    return lines[line]["out" if direction else "in"]
+
+
+def dwell_value(cam_entry, detectObj):
+    """Mean or longest current dwell (seconds) of the zone a sensorSelect code >= SELECT_FIRST_DWELL refers to."""
+    zone, stat = divmod(detectObj - SELECT_FIRST_DWELL, 2)
+    dwell = cam_entry.get("dwell", []) if cam_entry else []
+    if zone >= len(dwell):
+        return 0
+    return dwell[zone]["current_max_s" if stat else "mean_s"]
     
 class Mqtt_Connect(mqtt.Client):
     def __init__(self, device_id: str, device_version: str,device_key:str,cameras:CameraConnection):
@@ -117,6 +151,7 @@ class Mqtt_Connect(mqtt.Client):
                                 "/Update/optionOTA",                    #30 Get Update option
                                 "/Control/RequestImage",                #31
                                 "/Control/SetCrop",                     #32
+                                "/Control/RequestHeatmap",              #33 Get heatmap of a camera
                                 ]              
         
         # Period notification time options
@@ -185,6 +220,7 @@ class Mqtt_Connect(mqtt.Client):
                 self.device_key + self.subscribe_topics[29]: self.handle_update_ota_option,
                 self.device_key + self.subscribe_topics[30]: self.handle_request_image,  # 31
                 self.device_key + self.subscribe_topics[31]: self.handle_set_crop, 
+                self.device_key + self.subscribe_topics[32]: self.handle_request_heatmap,  # 33
         }
 
         self._relay_last_change = {}   # relayNo -> timestamp
@@ -642,6 +678,32 @@ class Mqtt_Connect(mqtt.Client):
         except Exception:
             logger.error("Failed to handle RequestImage", exc_info=True)
 
+    #33
+    def handle_request_heatmap(self, data):
+        try:
+            cameraNO = data.get("cameraNO") if isinstance(data, dict) else None
+            if cameraNO is None and HEATMAPS:
+                cameraNO = sorted(HEATMAPS)[0]
+            heatmap = HEATMAPS.get(cameraNO)
+            if heatmap is None:
+                logger.warning(f"RequestHeatmap: no heatmap for camera {cameraNO}")
+                self.publish(self.device_key + "/HeatmapResponse",
+                             payload=json.dumps({"cameraNO": cameraNO, "error": "no_heatmap"}),
+                             qos=2, retain=False)
+                return
+
+            jpg = heatmap.encode()
+            self.publish(
+                self.device_key + "/HeatmapResponse",
+                payload=json.dumps({"cameraNO": cameraNO, "image": base64.b64encode(jpg).decode("utf-8")}),
+                qos=2,
+                retain=False
+            )
+            logger.info(f"Sent HeatmapResponse for camera {cameraNO} via MQTT")
+
+        except Exception:
+            logger.error("Failed to handle RequestHeatmap", exc_info=True)
+
     #31
     def handle_set_crop(self, data):
         try:
@@ -1017,7 +1079,7 @@ class Mqtt_Connect(mqtt.Client):
         for i in range(self.number_of_sensor_value):
             sensor_config = self.current_setting[i]
             sensorNo   = sensor_config['sensorNo']
-            detectObj  = sensor_config['sensorSelect']     # 1=total, 2=area1, 3=area2
+            detectObj  = sensor_config['sensorSelect']     # 1=total, k+1=area k, 100+=line in/out, 300+=dwell
             cameraNO   = sensor_config['subSensorSelect']  # real cameraNO (not index)
             detect_cond = sensor_config['sensorOption']
             relay     = sensor_config['sensorControl']
@@ -1028,12 +1090,14 @@ class Mqtt_Connect(mqtt.Client):
             if cameraNO != 0 and detectObj != 0:
                 cam_entry = next((c for c in valuesList["cameras"] if c.get("cameraNO") == cameraNO), None)
 
-                if detectObj == 1:   # total
+                if detectObj == SELECT_TOTAL:
                     value = valuesList["total"]
-                elif detectObj == 2 and cam_entry:
-                    value = cam_entry["value"][0] if len(cam_entry["value"]) > 0 else 0
-                elif detectObj == 3 and cam_entry:
-                    value = cam_entry["value"][1] if len(cam_entry["value"]) > 1 else 0
+                elif detectObj >= SELECT_FIRST_DWELL:
+                    value = dwell_value(cam_entry, detectObj)
+                elif detectObj >= SELECT_FIRST_LINE:
+                    value = line_value(cam_entry, detectObj)
+                else:
+                    value = zone_value(cam_entry, detectObj)
 
                 self.publish(self.device_key + '/ValueSensor',
                             sensor_value_json(self.device_key, sensorNo, detectObj, int(value)),
@@ -1140,8 +1204,7 @@ class Mqtt_Connect(mqtt.Client):
         try:
             if self.number_cam !=0:
                 image_set = image[self.number_cam - 1]
-                image_prepared = image_set.copy()
-                _, buffer = cv2.imencode('.jpg', image_prepared)
+                _, buffer = cv2.imencode('.jpg', image_set)
                 image_file = BytesIO(buffer)
 
                 url_send_image = f'https://{self.api_server}/api/v2/aicam/send-camera-notifications'
@@ -1,152 +1,126 @@
-# Ultralytics YOLO 🚀, AGPL-3.0 license
-
-from collections import defaultdict
+#object_counter.py
+'''
+    Line / gate crossing counter driven by tracker output.
+
+    Track state lives in fixed-size arrays (slot per track, ring buffer of recent foot
+    points per slot); every frame all tracks are tested against all lines in one NumPy
+    pass: a crossing is a movement from one side of the line to the other whose path
+    intersects the line segment itself.
+'''
 import cv2
-from ultralytics.utils.checks import check_imshow, check_requirements
-from ultralytics.utils.plotting import Annotator, colors
-check_requirements("shapely>=2.0.0")
-from shapely.geometry import LineString, Point, Polygon
-
-
-class ObjectCounter:
-    def __init__(
-        self,
-        names,
-        reg_pts=None,
-        count_reg_color=(255, 0, 255),
-        count_txt_color=(0, 0, 0),
-        count_bg_color=(255, 255, 255),
-        line_thickness=2,
-        track_thickness=2,
-        view_img=False,
-        view_in_counts=True,
-        view_out_counts=True,
-        draw_tracks=False,
-        track_color=None,
-        region_thickness=5,
-        line_dist_thresh=15,
-        cls_txtdisplay_gap=50,
-    ):
-        self.is_drawing = False
-        self.selected_point = None
-        self.reg_pts = [(20, 400), (1260, 400)] if reg_pts is None else reg_pts
-        self.line_dist_thresh = line_dist_thresh
-        self.counting_region = None
-        self.region_color = count_reg_color
-        self.region_thickness = region_thickness
-        self.im0 = None
-        self.tf = line_thickness
-        self.view_img = view_img
-        self.view_in_counts = view_in_counts
-        self.view_out_counts = view_out_counts
-        self.names = names
-        self.annotator = None
-        self.window_name = "Ultralytics YOLOv8 Object Counter"
-        self.in_counts = 0
-        self.out_counts = 0
-        self.class_wise_count = {}
-        self.count_txt_thickness = 0
-        self.count_txt_color = count_txt_color
-        self.count_bg_color = count_bg_color
-        self.cls_txtdisplay_gap = cls_txtdisplay_gap
-        self.fontsize = 0.6
-        self.track_history = defaultdict(list)
-        self.track_thickness = track_thickness
-        self.draw_tracks = draw_tracks
-        self.track_color = track_color
-        self.env_check = check_imshow(warn=True)
-        self.value_counter = [0 for _ in range(12)]
-
-        if len(self.reg_pts) == 2:
-            print("Line Counter Initiated.")
-            self.counting_region = LineString(self.reg_pts)
-        elif len(self.reg_pts) >= 3:
-            print("Polygon Counter Initiated.")
-            self.counting_region = Polygon(self.reg_pts)
-        else:
-            print("Invalid Region points provided, region_points must be 2 for lines or >= 3 for polygons.")
-            print("Using Line Counter Now")
-            self.counting_region = LineString(self.reg_pts)
-
-    def extract_and_process_tracks(self, tracks):
-        self.annotator = Annotator(self.im0, self.tf, self.names)
-        self.annotator.draw_region(reg_pts=self.reg_pts, color=self.region_color, thickness=self.region_thickness)
-
-        if tracks[0].boxes.id is not None:
-            boxes = tracks[0].boxes.xyxy.cpu()
-            clss = tracks[0].boxes.cls.cpu().tolist()
-            track_ids = tracks[0].boxes.id.int().cpu().tolist()
-
-            for box, track_id, cls in zip(boxes, track_ids, clss):
-                if self.names[cls] not in self.class_wise_count:
-                    self.class_wise_count[self.names[cls]] = {"IN": self.value_counter[4], "OUT": self.value_counter[5]}
-
-                track_line = self.track_history[track_id]
-                track_line.append(((box[0] + box[2]) / 2, (box[1] + box[3]) / 2))
-                if len(track_line) > 30:
-                    track_line.pop(0)
-
-                if self.draw_tracks:
-                    self.annotator.draw_centroid_and_tracks(
-                        track_line,
-                        color=self.track_color or colors(int(track_id), True),
-                        track_thickness=self.track_thickness,
-                    )
-
-                if len(track_line) > 1:
-                    prev_position = track_line[-2]
-                    curr_position = track_line[-1]
-
-                    if len(self.reg_pts) == 2:
-                        A, B = self.reg_pts[0], self.reg_pts[1]
-
-                        def side(p):
-                            return (B[0] - A[0]) * (p[1] - A[1]) - (B[1] - A[1]) * (p[0] - A[0])
-
-                        prev_side = side(prev_position)
-                        curr_side = side(curr_position)
-
-                        if prev_side * curr_side < 0:
-                            if curr_side > prev_side:
-                                self.out_counts += 1
-                                self.value_counter[1] += 1
-                                self.value_counter[3] += 1
-                                self.value_counter[5] += 1
-                                self.value_counter[7] += 1
-                                self.value_counter[9] += 1
-                                self.class_wise_count[self.names[cls]]["OUT"] = self.value_counter[5]
-                            else:
-                                self.in_counts += 1
-                                self.value_counter[0] += 1
-                                self.value_counter[2] += 1
-                                self.value_counter[4] += 1
-                                self.value_counter[6] += 1
-                                self.value_counter[8] += 1
-                                self.class_wise_count[self.names[cls]]["IN"] = self.value_counter[4]
-
-        labels_dict = {}
-        for key, value in self.class_wise_count.items():
-            if value["IN"] != 0 or value["OUT"] != 0:
-                if not self.view_in_counts and not self.view_out_counts:
-                    continue
-                elif not self.view_in_counts:
-                    labels_dict[str.capitalize(key)] = f"OUT {value['OUT']}"
-                elif not self.view_out_counts:
-                    labels_dict[str.capitalize(key)] = f"IN {value['IN']}"
-                else:
-                    labels_dict[str.capitalize(key)] = f"IN {value['IN']} OUT {value['OUT']}"
-
-        if labels_dict:
-            self.annotator.display_analytics(self.im0, labels_dict, self.count_txt_color, self.count_bg_color, 10)
-
-
-
-    def start_counting(self, im0, tracks):
-        self.im0 = im0
-        self.extract_and_process_tracks(tracks)
-        return self.im0
-
-
-if __name__ == "__main__":
-    classes_names = {0: "person", 1: "car"}
-    ObjectCounter(classes_names)
+import numpy as np
+
+
+class LineCrossingCounter:
+    """In/out totals for a set of counting lines.
+
+    `lines` is a list of {"coord": [[x1, y1], [x2, y2]], "name": str}. Crossing from the
+    right-hand side of A->B (as seen on screen) to its left counts as "in", the opposite
+    as "out"; swap A and B to flip.
+    """
+
+    def __init__(self, lines=None, capacity=64, history=16, ttl=30):
+        self.capacity = capacity
+        self.history = history
+        self.ttl = ttl                                          # frames a lost track keeps its slot
+        self.ids = np.full(capacity, -1, np.int64)              # track id per slot, -1 = free
+        self.trail = np.zeros((capacity, history, 2), np.float32)
+        self.head = np.zeros(capacity, np.int64)                # next write index into trail
+        self.length = np.zeros(capacity, np.int64)              # valid points in trail
+        self.last_seen = np.zeros(capacity, np.int64)
+        self.frame = 0
+        self.names = []
+        self.a = np.zeros((0, 2), np.float32)                   # line start points (L, 2)
+        self.b = np.zeros((0, 2), np.float32)                   # line end points (L, 2)
+        self.in_counts = np.zeros(0, np.int64)
+        self.out_counts = np.zeros(0, np.int64)
+        self._key = None
+        self.set_lines(lines or [])
+
+    def set_lines(self, lines):
+        """Replace the counting lines; totals are kept for lines whose coordinates are unchanged."""
+        lines = [l for l in lines if len(l.get("coord") or []) == 2]
+        key = tuple((tuple(map(tuple, l["coord"])), l.get("name", "")) for l in lines)
+        if key == self._key:
+            return
+        old = {k: (i, o) for k, i, o in zip(self._key or (), self.in_counts, self.out_counts)}
+        self._key = key
+        self.names = [l.get("name") or f"Line-{i + 1}" for i, l in enumerate(lines)]
+        coords = np.asarray([l["coord"] for l in lines], np.float32).reshape(-1, 2, 2)
+        self.a, self.b = coords[:, 0], coords[:, 1]
+        self.in_counts = np.array([old.get(k, (0, 0))[0] for k in key], np.int64)
+        self.out_counts = np.array([old.get(k, (0, 0))[1] for k in key], np.int64)
+
+    def _slots_for(self, ids):
+        """Slot index per track id, claiming free (or the stalest) slots for new ids."""
+        order = np.argsort(self.ids)
+        pos = np.searchsorted(self.ids[order], ids)
+        pos = np.minimum(pos, self.capacity - 1)
+        slots = order[pos]
+        new = self.ids[slots] != ids
+        self.last_seen[slots[~new]] = self.frame     # matched slots are not eviction candidates
+        for k in np.flatnonzero(new):
+            free = np.flatnonzero(self.ids < 0)
+            slot = free[0] if len(free) else int(np.argmin(self.last_seen))
+            self.ids[slot] = ids[k]
+            self.length[slot] = 0
+            self.head[slot] = 0
+            self.last_seen[slot] = self.frame
+            slots[k] = slot
+        return slots
+
+    def update(self, boxes, ids):
+        """Feed one frame of tracked boxes (N, >=4) and their IDs; returns (in, out) crossings this frame."""
+        self.frame += 1
+        stale = (self.ids >= 0) & (self.frame - self.last_seen > self.ttl)
+        self.ids[stale] = -1
+        n_lines = len(self.a)
+        if boxes is None or ids is None or len(boxes) == 0:
+            return np.zeros(n_lines, np.int64), np.zeros(n_lines, np.int64)
+
+        ids = np.asarray(ids, np.int64)
+        boxes = np.asarray(boxes, np.float32)
+        curr = np.stack([(boxes[:, 0] + boxes[:, 2]) * 0.5, boxes[:, 3]], axis=1)   # foot point
+        slots = self._slots_for(ids)
+        has_prev = self.length[slots] > 0
+        prev = self.trail[slots, (self.head[slots] - 1) % self.history]
+
+        # ring write
+        self.trail[slots, self.head[slots]] = curr
+        self.head[slots] = (self.head[slots] + 1) % self.history
+        self.length[slots] = np.minimum(self.length[slots] + 1, self.history)
+        self.last_seen[slots] = self.frame
+
+        crossed_in = np.zeros(n_lines, np.int64)
+        crossed_out = np.zeros(n_lines, np.int64)
+        if n_lines == 0 or not has_prev.any():
+            return crossed_in, crossed_out
+        p, q = prev[has_prev], curr[has_prev]                              # (M, 2)
+        a, d = self.a[None], (self.b - self.a)[None]                        # (1, L, 2)
+        side_p = d[..., 0] * (p[:, None, 1] - a[..., 1]) - d[..., 1] * (p[:, None, 0] - a[..., 0])
+        side_q = d[..., 0] * (q[:, None, 1] - a[..., 1]) - d[..., 1] * (q[:, None, 0] - a[..., 0])
+        # the movement must also straddle the line segment, not just its infinite extension
+        m = (q - p)[:, None]                                                # (M, 1, 2)
+        side_a = m[..., 0] * (a[..., 1] - p[:, None, 1]) - m[..., 1] * (a[..., 0] - p[:, None, 0])
+        side_b = (m[..., 0] * (self.b[None, :, 1] - p[:, None, 1])
+                  - m[..., 1] * (self.b[None, :, 0] - p[:, None, 0]))
+        # a point exactly on the line counts as the positive side, so touching it is not a crossing
+        crossing = ((side_p < 0) != (side_q < 0)) & (side_a * side_b <= 0)  # (M, L)
+        crossed_out = (crossing & (side_q > side_p)).sum(axis=0)
+        crossed_in = (crossing & (side_q < side_p)).sum(axis=0)
+        self.in_counts += crossed_in
+        self.out_counts += crossed_out
+        return crossed_in, crossed_out
+
+    def totals(self):
+        """[{"name", "in", "out"}, ...] per line."""
+        return [{"name": name, "in": int(i), "out": int(o)}
+                for name, i, o in zip(self.names, self.in_counts, self.out_counts)]
+
+    def draw(self, img, color=(255, 0, 255), thickness=2):
+        for name, a, b, i, o in zip(self.names, self.a, self.b, self.in_counts, self.out_counts):
+            p1, p2 = tuple(map(int, a)), tuple(map(int, b))
+            cv2.line(img, p1, p2, color, thickness)
+            cv2.putText(img, f"{name} IN {i} OUT {o}", (min(p1[0], p2[0]), min(p1[1], p2[1]) - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        return img
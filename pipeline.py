@@ -0,0 +1,161 @@
+#pipeline.py
+'''
+    Pipeline plumbing for the main loop: bounded drop-oldest channels and stage workers.
+
+    capture -> inference -> render -> publish / stream / record
+    Each stage runs in its own thread; a slow consumer only ever loses its own
+    oldest items and never blocks the stage that feeds it.
+'''
+import queue
+import threading
+import time
+from collections import deque
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class DropOldestQueue:
+    """Bounded channel whose put() never blocks: when full, the oldest item is discarded."""
+
+    def __init__(self, name, maxsize=2):
+        self.name = name
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item, block=True, timeout=None):
+        # block/timeout are accepted for queue.Queue compatibility and ignored
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+
+    put_nowait = put
+
+    def get(self, block=True, timeout=None):
+        with self._cond:
+            if not block:
+                if not self._items:
+                    raise queue.Empty
+                return self._items.popleft()
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+            return self._items.popleft()
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+    def stats(self):
+        with self._cond:
+            return {"depth": len(self._items), "maxsize": self.maxsize,
+                    "put": self.put_count, "dropped": self.dropped}
+
+
+class LatestPerKeyQueue:
+    """Channel of pending work per key (e.g. per camera) whose put() never blocks.
+
+    put() merges a {key: item} dict into what is waiting, so a newer item only ever replaces
+    an older one of the same key; get() takes everything pending as one dict.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._items = {}
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0        # items replaced by a newer one of the same key
+
+    def put(self, items, block=True, timeout=None):
+        with self._cond:
+            self.dropped += sum(1 for key in items if key in self._items)
+            self._items.update(items)
+            self.put_count += len(items)
+            self._cond.notify()
+
+    put_nowait = put
+
+    def get(self, block=True, timeout=None):
+        with self._cond:
+            if not self._items and (not block or not self._cond.wait_for(lambda: self._items, timeout)):
+                raise queue.Empty
+            items, self._items = self._items, {}
+            return items
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+    def stats(self):
+        with self._cond:
+            return {"depth": len(self._items), "put": self.put_count, "dropped": self.dropped}
+
+
+class Stage(threading.Thread):
+    """Worker that applies `fn` to every item of `inbox` and fans the result out to `outboxes`.
+
+    A stage without an inbox is a source: `fn()` is called in a loop and paced by `interval`.
+    `fn` may return None to emit nothing for that item. `on_start` runs once in the
+    stage's own thread before the loop (e.g. to pin it to a CPU set).
+    """
+
+    def __init__(self, name, fn, inbox=None, outboxes=(), interval=0.0, gate=None, on_start=None):
+        super().__init__(name=f"stage-{name}", daemon=True)
+        self.stage_name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outboxes = list(outboxes)
+        self.interval = interval
+        self.gate = gate            # optional Event; the stage idles while it is cleared
+        self.on_start = on_start
+        self.running = True
+        self.processed = 0
+        self.errors = 0
+        self.last_latency = 0.0
+
+    def run(self):
+        if self.on_start is not None:
+            self.on_start()
+        while self.running:
+            if self.gate is not None and not self.gate.wait(timeout=0.5):
+                continue
+            if self.inbox is not None:
+                try:
+                    item = self.inbox.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                args = (item,)
+            else:
+                args = ()
+            start = time.perf_counter()
+            try:
+                result = self.fn(*args)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Stage {self.stage_name} failed: {e}", exc_info=True)
+                time.sleep(0.01)
+                continue
+            self.last_latency = time.perf_counter() - start
+            self.processed += 1
+            if result is not None:
+                for out in self.outboxes:
+                    out.put(result)
+            if self.inbox is None and self.interval > self.last_latency:
+                time.sleep(self.interval - self.last_latency)
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "latency_ms": round(self.last_latency * 1000, 2),
+            "queue": self.inbox.stats() if self.inbox is not None else None,
+        }
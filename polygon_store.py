@@ -5,10 +5,17 @@ import threading
 from typing import List, Dict, Any, Optional
 import os
 
+from boxprocess import ZoneMasks
+
+MAX_POLYGONS_PER_CAM = ZoneMasks.MAX_ZONES  # as many zones as counting supports per camera
+MIN_POLYGONS_PER_CAM = 2    # area1 / area2 slots always exist for the MQTT sensor mapping
+
+
 class PolygonStore:
-    def __init__(self, path: Path | str = "polygons.json", max_polygons_per_cam: int = 2):
+    def __init__(self, path: Path | str = "polygons.json", max_polygons_per_cam: int = MAX_POLYGONS_PER_CAM):
         self.path = Path(path)
         self.max_polygons = max_polygons_per_cam
+        self.min_polygons = min(MIN_POLYGONS_PER_CAM, max_polygons_per_cam)
         self._lock = threading.Lock()
         self._data: Dict[str, Any] = {
             "selected_cam_id": None,
@@ -59,11 +66,13 @@ class PolygonStore:
         return None
 
     def _ensure_cam(self, cam_id: int) -> Dict[str, Any]:
+        existing = self._find_cam(cam_id)
         # Remove duplicates
         self._data["cameras"] = [c for c in self._data["cameras"] if c.get("id") != cam_id]
         cam = {
             "id": cam_id,
-            "polygons": [{"coord": [], "seen": 0, "name": ""} for _ in range(self.max_polygons)]
+            "polygons": [{"coord": [], "seen": 0, "name": ""} for _ in range(self.min_polygons)],
+            "lines": existing.get("lines", []) if existing else []
         }
         self._data["cameras"].append(cam)
         return cam
@@ -90,15 +99,30 @@ class PolygonStore:
                     "seen": int(p.get("seen", 0)),
                     "name": str(p.get("name", "")),
                 })
-            while len(fixed) < self.max_polygons:
+            while len(fixed) < self.min_polygons:
                 fixed.append({"coord": [], "seen": 0, "name": ""})
             cam["polygons"] = fixed
             self._save()
 
+    def get_lines(self, cam_id: int) -> List[Dict[str, Any]]:
+        """Counting lines of a camera: [{"coord": [[x1, y1], [x2, y2]], "name": str}, ...]."""
+        with self._lock:
+            self._maybe_reload()
+            cam = self._find_cam(cam_id)
+            return json.loads(json.dumps(cam.get("lines", []))) if cam else []
+
+    def set_lines(self, cam_id: int, lines: List[Dict[str, Any]]):
+        with self._lock:
+            cam = self._find_cam(cam_id) or self._ensure_cam(cam_id)
+            cam["lines"] = [{"coord": l.get("coord", [])[:2], "name": str(l.get("name", f"Line-{i + 1}"))}
+                            for i, l in enumerate(lines[: self.max_polygons])
+                            if len(l.get("coord", [])) >= 2]
+            self._save()
+
     def clear_polygons(self, cam_id: Optional[int] = None):
         with self._lock:
             def empty_polys():
-                return [{"coord": [], "seen": 0, "name": ""} for _ in range(self.max_polygons)]
+                return [{"coord": [], "seen": 0, "name": ""} for _ in range(self.min_polygons)]
 
             if cam_id is None:
                 for cam in self._data["cameras"]:
@@ -133,7 +157,8 @@ class PolygonStore:
                 if not any(d.get("id") == cam_id for d in self._data["deleted_ids"]):
                     self._data["deleted_ids"].append({
                         "id": cam_id,
-                        "polygons": json.loads(json.dumps(donor["polygons"]))
+                        "polygons": json.loads(json.dumps(donor["polygons"])),
+                        "lines": json.loads(json.dumps(donor.get("lines", [])))
                     })
                 self._data["cameras"] = [c for c in self._data["cameras"] if c.get("id") != cam_id]
             self._save()
@@ -145,7 +170,9 @@ class PolygonStore:
             if self._data["deleted_ids"]:
                 donor = self._data["deleted_ids"].pop(0)
                 poly = json.loads(json.dumps(donor["polygons"]))
-                self._ensure_cam(new_id)["polygons"] = poly
+                cam = self._ensure_cam(new_id)
+                cam["polygons"] = poly
+                cam["lines"] = donor.get("lines", [])
             else:
                 self._ensure_cam(new_id)
             self._save()
@@ -170,6 +170,10 @@ class MultiCameraRecorder:
         except Exception as e:
             logger.error(f"[Recorder] Error writing video: {e}", exc_info=True)
 
+    def record_video_dict(self, frames_by_no: Dict[int, Any]):
+        """Record frames keyed by cameraNO; cameras map to writer slots in cameraNO order."""
+        self.record_video([frames_by_no[no] for no in sorted(frames_by_no)])
+
     def close(self):
         """Close all video writers."""
         for cam_index, writer in list(self.out_writers.items()):
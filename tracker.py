@@ -0,0 +1,197 @@
+#tracker.py
+'''
+    Lightweight ByteTrack-style multi-object tracker.
+
+    Track state lives in preallocated NumPy arrays (one row per slot); the Kalman
+    predict/update steps and IoU association run vectorized over all tracks. predict
+    is cheap enough to call on every frame, update only when the detector ran.
+'''
+import threading
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """IoU between every xyxy box in `a` (N, 4) and `b` (M, 4)."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-7)
+
+
+def greedy_match(score, thresh):
+    """Pairs (row, col) taken in descending score order while score >= thresh."""
+    matches = []
+    if score.size == 0:
+        return matches
+    score = score.copy()
+    for _ in range(min(score.shape)):
+        r, c = np.unravel_index(score.argmax(), score.shape)
+        if score[r, c] < thresh:
+            break
+        matches.append((r, c))
+        score[r, :] = -1
+        score[:, c] = -1
+    return matches
+
+
+class ByteTracker:
+    """Two-stage IoU association (high then low confidence) over a constant-velocity Kalman filter.
+
+    State per track: [cx, cy, w, h, vcx, vcy, vw, vh]. `missed` counts detector runs
+    without a match, so tracks survive long gaps when the detector is gated off;
+    `coast` counts frames predicted since the last match and stops extrapolation
+    after `max_coast` frames.
+    """
+
+    STD_POS = 1 / 20
+    STD_VEL = 1 / 160
+
+    def __init__(self, capacity=64, high_thresh=0.5, low_thresh=0.1, new_thresh=0.5,
+                 match_iou=0.3, low_match_iou=0.5, max_lost=30, max_coast=15, min_hits=1):
+        self.capacity = capacity
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.new_thresh = new_thresh
+        self.match_iou = match_iou
+        self.low_match_iou = low_match_iou
+        self.max_lost = max_lost
+        self.max_coast = max_coast
+        self.min_hits = min_hits
+
+        self.mean = np.zeros((capacity, 8), np.float32)
+        self.cov = np.zeros((capacity, 8, 8), np.float32)
+        self.ids = np.full(capacity, -1, np.int64)      # -1 = free slot
+        self.hits = np.zeros(capacity, np.int32)
+        self.missed = np.zeros(capacity, np.int32)
+        self.coast = np.zeros(capacity, np.int32)
+        self.conf = np.zeros(capacity, np.float32)
+        self.cls = np.zeros(capacity, np.float32)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+        self.F = np.eye(8, dtype=np.float32)
+        self.F[:4, 4:] = np.eye(4, dtype=np.float32)
+
+    # ---------------- Kalman helpers ----------------
+    @staticmethod
+    def _xyxy_to_cxcywh(b):
+        return np.stack([(b[:, 0] + b[:, 2]) / 2, (b[:, 1] + b[:, 3]) / 2,
+                         b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]], axis=1)
+
+    def _boxes(self, idx):
+        m = self.mean[idx]
+        half = m[:, 2:4] / 2
+        return np.concatenate([m[:, :2] - half, m[:, :2] + half], axis=1)
+
+    def _predict(self, idx):
+        if len(idx) == 0:
+            return
+        h = self.mean[idx, 3:4]
+        std = np.concatenate([np.repeat(self.STD_POS * h, 4, axis=1),
+                              np.repeat(self.STD_VEL * h, 4, axis=1)], axis=1)
+        self.mean[idx] = self.mean[idx] @ self.F.T
+        cov = np.einsum("ij,njk,lk->nil", self.F, self.cov[idx], self.F)
+        cov[:, np.arange(8), np.arange(8)] += std ** 2
+        self.cov[idx] = cov
+
+    def _update(self, idx, z):
+        P = self.cov[idx]
+        h = self.mean[idx, 3:4]
+        S = P[:, :4, :4].copy()
+        S[:, np.arange(4), np.arange(4)] += (self.STD_POS * np.repeat(h, 4, axis=1)) ** 2
+        PHt = P[:, :, :4]                                           # (n, 8, 4)
+        K = np.linalg.solve(S, PHt.transpose(0, 2, 1)).transpose(0, 2, 1)
+        y = z - self.mean[idx, :4]
+        self.mean[idx] += np.einsum("nij,nj->ni", K, y)
+        self.cov[idx] = P - K @ P[:, :4, :]
+
+    def _init(self, slots, z, dets):
+        h = z[:, 3:4]
+        self.mean[slots] = 0
+        self.mean[slots, :4] = z
+        std = np.concatenate([np.repeat(2 * self.STD_POS * h, 4, axis=1),
+                              np.repeat(10 * self.STD_VEL * h, 4, axis=1)], axis=1)
+        self.cov[slots] = 0
+        self.cov[slots[:, None], np.arange(8), np.arange(8)] = std ** 2
+        n = len(slots)
+        self.ids[slots] = np.arange(self._next_id, self._next_id + n)
+        self._next_id += n
+        self.hits[slots] = 1
+        self.missed[slots] = 0
+        self.coast[slots] = 0
+        self.conf[slots] = dets[:, 4]
+        self.cls[slots] = dets[:, 5]
+
+    # ---------------- public API ----------------
+    def update(self, detections):
+        """Associate one detector run, (N, 6) x1, y1, x2, y2, conf, cls."""
+        with self._lock:
+            active = np.flatnonzero(self.ids >= 0)
+            dets = detections[detections[:, 4] >= self.low_thresh] if len(detections) else detections
+            high = np.flatnonzero(dets[:, 4] >= self.high_thresh) if len(dets) else np.empty(0, np.int64)
+            low = np.flatnonzero(dets[:, 4] < self.high_thresh) if len(dets) else np.empty(0, np.int64)
+
+            track_boxes = self._boxes(active)
+            matched_t, matched_d = [], []
+
+            # stage 1: confident detections against every live track
+            iou = iou_matrix(dets[high, :4], track_boxes)
+            for d, t in greedy_match(iou, self.match_iou):
+                matched_d.append(high[d])
+                matched_t.append(active[t])
+            unmatched_high = np.setdiff1d(high, matched_d, assume_unique=True)
+
+            # stage 2: weak detections only against tracks that were seen last run
+            rest = active[~np.isin(active, matched_t) & (self.missed[active] == 0)]
+            if len(rest) and len(low):
+                iou = iou_matrix(dets[low, :4], self._boxes(rest))
+                for d, t in greedy_match(iou, self.low_match_iou):
+                    matched_d.append(low[d])
+                    matched_t.append(rest[t])
+
+            matched_t = np.asarray(matched_t, np.int64)
+            matched_d = np.asarray(matched_d, np.int64)
+            if len(matched_t):
+                self._update(matched_t, self._xyxy_to_cxcywh(dets[matched_d, :4]))
+                self.hits[matched_t] += 1
+                self.missed[matched_t] = 0
+                self.coast[matched_t] = 0
+                self.conf[matched_t] = dets[matched_d, 4]
+                self.cls[matched_t] = dets[matched_d, 5]
+
+            lost = np.setdiff1d(active, matched_t, assume_unique=True)
+            self.missed[lost] += 1
+            self.ids[lost[self.missed[lost] > self.max_lost]] = -1
+
+            new = unmatched_high[dets[unmatched_high, 4] >= self.new_thresh]
+            if len(new):
+                free = np.flatnonzero(self.ids < 0)
+                if len(free) < len(new):
+                    # evict the longest-lost tracks to make room
+                    victims = np.flatnonzero(self.ids >= 0)
+                    victims = victims[np.argsort(-self.missed[victims])][:len(new) - len(free)]
+                    victims = victims[self.missed[victims] > 0]
+                    self.ids[victims] = -1
+                    free = np.flatnonzero(self.ids < 0)
+                new = new[:len(free)]
+                self._init(free[:len(new)], self._xyxy_to_cxcywh(dets[new, :4]), dets[new])
+
+    def step(self):
+        """Advance one frame and return (boxes (N, 6), ids (N,)) of the visible tracks."""
+        with self._lock:
+            moving = np.flatnonzero((self.ids >= 0) & (self.coast < self.max_coast))
+            self._predict(moving)
+            self.coast[moving] += 1
+            visible = np.flatnonzero((self.ids >= 0) & (self.missed == 0) & (self.hits >= self.min_hits))
+            boxes = np.concatenate([self._boxes(visible), self.conf[visible, None],
+                                    self.cls[visible, None]], axis=1).astype(np.float32)
+            return boxes, self.ids[visible].copy()
+
+    def active_count(self):
+        return int((self.ids >= 0).sum())
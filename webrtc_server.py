@@ -16,6 +16,7 @@ import json
 import time
 import base64
 from polygon_store import PolygonStore
+from heatmap import HEATMAPS
 from pathlib import Path
 import sys, os
 
@@ -48,7 +49,7 @@ def _static_dir() -> Path:
     raise FileNotFoundError("static not found; tried:\n" + "\n".join(map(str, candidates)))
 
 # ----------------------------------------------------------------------
-store = PolygonStore(Path("polygons.json"), max_polygons_per_cam=2)
+store = PolygonStore(Path("polygons.json"))
 
 data = store.get_all()
 _current_sel_id = data.get("selected_cam_id")
@@ -91,6 +92,10 @@ class FrameTrack(VideoStreamTrack):
             await asyncio.sleep(0.05)  # wait before retry
             return await self.recv()
 
+def viewer_count() -> int:
+    """WebRTC peers currently attached (closed ones are discarded on state change)."""
+    return len(pcs)
+
 async def cleanup_stale_peers():
     while True:
         await asyncio.sleep(10)  # Check every 10 seconds instead of 30
@@ -140,11 +145,27 @@ async def get_polygons(request):
 
         return web.json_response({
             "cameras": cameras,
-            "selected_cam_id": sel_id
+            "selected_cam_id": sel_id,
+            "max_polygons": store.max_polygons
         })
     except Exception as e:
         return web.json_response({"ok": False, "error": str(e)}, status=500)
 
+async def save_lines(request):
+    try:
+        data = await request.json()
+        cam_id = int(data.get("camera_id"))
+        lines = data.get("lines", [])
+
+        cameras = store.get_all()["cameras"]
+        if cam_id not in [c.get("id") for c in cameras]:
+            return web.json_response({"ok": False, "error": f"camera_id {cam_id} not found"}, status=400)
+
+        store.set_lines(cam_id, lines)
+        return web.json_response({"ok": True, "saved": len(store.get_lines(cam_id)), "camera_id": cam_id})
+    except Exception as e:
+        return web.json_response({"ok": False, "error": str(e)}, status=500)
+
 async def clear_polygons(request):
     try:
         data = {}
@@ -174,12 +195,28 @@ async def save_polygons(request):
         if cam_id not in [c.get("id") for c in cameras]:
             return web.json_response({"ok": False, "error": f"camera_id {cam_id} not found"}, status=400)
 
+        if len(polygons) > store.max_polygons:
+            return web.json_response({"ok": False, "error": f"at most {store.max_polygons} polygons per camera"},
+                                     status=400)
+
         store.set_polygons(cam_id, polygons)
         return web.json_response({"ok": True, "saved": len(polygons), "camera_id": cam_id})
     except Exception as e:
         return web.json_response({"ok": False, "error": str(e)}, status=500)
 
 async def get_captured_image_jpg(request):
+    # frames are only annotated and pushed while someone watches: ask for fresh ones
+    requested = time.time()
+    FrameSource.request_render()
+    fresh = 0
+    for _ in range(40):
+        _, timestamp = FrameSource.get_frame()
+        if timestamp > requested:
+            fresh += 1
+            if fresh >= 2:      # the first one may have been rendered before the request
+                break
+            requested = timestamp
+        await asyncio.sleep(0.05)
     frame = FrameSource.latest_raw_frame
     if frame is None:
         return web.Response(status=503, text="No frame available yet")
@@ -221,6 +258,28 @@ async def get_captured_image_jpg(request):
         headers={"Cache-Control": "no-store, no-cache, must-revalidate, max-age=0"}
     )
 
+async def get_heatmap_jpg(request):
+    try:
+        cam_id = int(request.query.get("camera_id", current_stream.get("selected_cam_id") or 0))
+    except ValueError:
+        return web.Response(status=400, text="Invalid camera_id")
+    heatmap = HEATMAPS.get(cam_id)
+    if heatmap is None:
+        return web.Response(status=404, text=f"No heatmap for camera {cam_id}")
+    try:
+        q = max(70, min(95, int(request.query.get("q", 85))))
+        blend = max(0.0, min(1.0, float(request.query.get("blend", 0.5))))
+    except ValueError:
+        q, blend = 85, 0.5
+    jpg = heatmap.encode(quality=q, blend=blend)
+    if jpg is None:
+        return web.Response(status=500, text="Failed to encode image")
+    return web.Response(
+        body=jpg,
+        content_type="image/jpeg",
+        headers={"Cache-Control": "no-store, no-cache, must-revalidate, max-age=0"}
+    )
+
 async def offer(request):
     try:
         params = await request.json()
@@ -274,12 +333,14 @@ def start_webrtc_server():
     app.router.add_post("/set_frame", set_frame)
     app.router.add_post("/save_polygons", save_polygons)
     app.router.add_post("/clear_polygons", clear_polygons)
+    app.router.add_post("/save_lines", save_lines)
 
     # print(current_stream)
 
     #redirect_video_feed
     app.router.add_get("/video_feed", redirect_video_feed)
     app.router.add_get("/capture.jpg", get_captured_image_jpg)   # binary image
+    app.router.add_get("/heatmap.jpg", get_heatmap_jpg)          # ?camera_id=&q=&blend=
     app.router.add_get("/polygons.json", get_polygons)
 
 
@@ -0,0 +1,128 @@
+#zone_analytics.py
+'''
+    Per-zone dwell time from tracker output.
+
+    All state is preallocated: a slot per track with its entry / last-inside time for every
+    zone, and a ring of the most recent completed visit durations per zone. Memory is fixed
+    by (capacity, zones, window) no matter how long the device runs.
+'''
+import time
+import numpy as np
+
+
+class DwellTracker:
+    """Enter/exit bookkeeping for tracks against N zones, with rolling dwell statistics.
+
+    A visit opens when a track is first seen inside a zone and closes once the track has
+    been outside it for `exit_grace` seconds (absorbs footprint jitter on the edge) or has
+    not been seen at all for `ttl` seconds. Visits shorter than `min_dwell` are ignored.
+    update() is the per-frame part; stats() is recomputed at most every `stats_interval` seconds.
+    """
+
+    def __init__(self, zones=2, capacity=128, window=256, ttl=3.0, exit_grace=1.0, min_dwell=0.5,
+                 stats_interval=1.0):
+        self.capacity = capacity
+        self.window = window
+        self.ttl = ttl
+        self.exit_grace = exit_grace
+        self.min_dwell = min_dwell
+        self.stats_interval = stats_interval
+        self.ids = np.full(capacity, -1, np.int64)      # track id per slot, -1 = free
+        self.last_seen = np.zeros(capacity, np.float64)
+        self.reset(zones)
+
+    def reset(self, zones):
+        """Forget all visits (zone set changed)."""
+        self.zones = zones
+        self.ids[:] = -1
+        self.enter = np.full((self.capacity, zones), np.nan)        # NaN = not in the zone
+        self.last_inside = np.zeros((self.capacity, zones), np.float64)
+        self.dwell = np.zeros((zones, self.window), np.float32)     # completed visits, ring per zone
+        self.head = np.zeros(zones, np.int64)
+        self.filled = np.zeros(zones, np.int64)
+        self.visits = np.zeros(zones, np.int64)
+        self._stats = None          # (monotonic time, result) of the last stats() computation
+
+    def _slots_for(self, ids, now):
+        order = np.argsort(self.ids)
+        pos = np.minimum(np.searchsorted(self.ids[order], ids), self.capacity - 1)
+        slots = order[pos]
+        new = self.ids[slots] != ids
+        self.last_seen[slots[~new]] = now
+        for k in np.flatnonzero(new):
+            free = np.flatnonzero(self.ids < 0)
+            if len(free):
+                slot = free[0]
+            else:
+                slot = int(np.argmin(self.last_seen))
+                self._close(np.array([slot]), np.ones((1, self.zones), bool))
+            self.ids[slot] = ids[k]
+            self.enter[slot] = np.nan
+            self.last_seen[slot] = now
+            slots[k] = slot
+        return slots
+
+    def _close(self, slots, mask):
+        """Record and clear the open visits of `slots` selected by `mask` (len(slots), Z)."""
+        mask = mask & ~np.isnan(self.enter[slots])
+        if not mask.any():
+            return
+        rows, zones = np.nonzero(mask)
+        durations = self.last_inside[slots[rows], zones] - self.enter[slots[rows], zones]
+        for zone, duration in zip(zones, durations):
+            if duration >= self.min_dwell:
+                self.dwell[zone, self.head[zone]] = duration
+                self.head[zone] = (self.head[zone] + 1) % self.window
+                self.filled[zone] = min(self.filled[zone] + 1, self.window)
+                self.visits[zone] += 1
+        self.enter[slots[rows], zones] = np.nan
+
+    def update(self, ids, inside, now=None):
+        """`ids` (N,) track IDs and `inside` (N, Z) zone membership for the current frame."""
+        now = time.monotonic() if now is None else now
+        active = np.flatnonzero(self.ids >= 0)
+        expired = active[now - self.last_seen[active] > self.ttl]
+        if len(expired):
+            self._close(expired, np.ones((len(expired), self.zones), bool))
+            self.ids[expired] = -1
+
+        if ids is not None and len(ids):
+            ids = np.asarray(ids, np.int64)
+            inside = np.asarray(inside, bool)[:, :self.zones]
+            slots = self._slots_for(ids, now)
+            entering = inside & np.isnan(self.enter[slots])
+            rows, zones = np.nonzero(entering)
+            self.enter[slots[rows], zones] = now
+            rows, zones = np.nonzero(inside)
+            self.last_inside[slots[rows], zones] = now
+
+        # visits whose track has been outside the zone for longer than the grace period
+        active = np.flatnonzero(self.ids >= 0)
+        gone = ~np.isnan(self.enter[active]) & (now - self.last_inside[active] > self.exit_grace)
+        self._close(active, gone)
+
+    def stats(self, now=None):
+        """Per zone: completed-visit mean / p50 / p90 seconds over the window, visit count, current dwellers.
+
+        Cached for `stats_interval` seconds: callers may ask every frame, it is only consumed
+        when results are published.
+        """
+        now = time.monotonic() if now is None else now
+        if self._stats is not None and 0 <= now - self._stats[0] < self.stats_interval:
+            return self._stats[1]
+        occupied = ~np.isnan(self.enter)
+        out = []
+        for z in range(self.zones):
+            recent = self.dwell[z, :self.filled[z]]
+            current = now - self.enter[occupied[:, z], z]
+            p50, p90 = np.percentile(recent, (50, 90)) if len(recent) else (0.0, 0.0)
+            out.append({
+                "mean_s": round(float(recent.mean()), 1) if len(recent) else 0.0,
+                "p50_s": round(float(p50), 1),
+                "p90_s": round(float(p90), 1),
+                "visits": int(self.visits[z]),
+                "current": int(len(current)),
+                "current_max_s": round(float(current.max()), 1) if len(current) else 0.0,
+            })
+        self._stats = (now, out)
+        return out